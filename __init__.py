@@ -1 +1 @@
-from pyGuerilla import ModificationContext, Document, Node, Plug, Camera, toLua, fromLua, Gtypes, Command
+from pyGuerilla import ModificationContext, PendingNode, PendingPlug, Document, Node, Plug, Camera, Point3Array, toLua, fromLua, Gtypes, Command, registerToLua, LuaDict, LuaList, SceneCapture, SceneChange, diffScenes, PlugGraph
@@ -102,23 +102,429 @@ with ModificationContext() as mod:
 
 import os
 import re
+import array
+import ast
+import bisect
+import collections
+import fnmatch
+import itertools
+import math
+import operator
+import shutil
+import tempfile
+import threading
+import weakref
 import lua
 
-def toLua( obj ):
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+# lua helper functions source, see _luaFunction
+_luaSources = {}
+# compiled lua helper functions
+_luaFunctions = {}
+
+def _luaFunction( name ):
+
+    '''
+    Retrieve a lua helper function, compile it on first use
+
+    @param name (str)
+    helper name (key of _luaSources)
+    @return (lua function)
+    compiled helper
+    '''
+
+    try:
+        return _luaFunctions[name]
+    except KeyError:
+        func = _luaFunctions[name] = lua.eval( _luaSources[name] )
+        return func
+
+# packed string of numbers -> lua table
+# width == 0: flat table, else table of rows (point3 if asPoint3)
+# non-finite numbers are packed as python repr: inf, -inf, nan
+_luaSources['unpacknumbers'] = '''
+function( packed, width, asPoint3 )
+    local t = {}
+    local n, k, row = 0, 0, nil
+    local tonumber = tonumber
+    local nonFinite = { inf = 1 / 0, ['-inf'] = -1 / 0, nan = 0 / 0 }
+    for token in string.gmatch( packed, '%S+' ) do
+        local v = tonumber( token ) or nonFinite[token]
+        if width == 0 then
+            n = n + 1
+            t[n] = v
+        else
+            if k == 0 then
+                row = {}
+                n = n + 1
+                t[n] = row
+            end
+            k = k + 1
+            row[k] = v
+            if k == width then
+                k = 0
+                if asPoint3 then
+                    t[n] = point3.create( row[1], row[2], row[3] )
+                end
+            end
+        end
+    end
+    return t
+end
+'''
+
+# lua table -> packed string of numbers, row width and point3 flag
+# return nil if the table is not a flat array of numbers or an array of
+# rows of numbers (plain tables or point3) with the same width
+_luaSources['packnumbers'] = '''
+function( t )
+    local n = #t
+    if n == 0 then
+        return nil
+    end
+    local format, out = string.format, {}
+    local first = t[1]
+    if type( first ) == 'number' then
+        for i = 1, n do
+            local v = t[i]
+            if type( v ) ~= 'number' then
+                return nil
+            end
+            out[i] = format( '%.17g', v )
+        end
+        return table.concat( out, ' ' ), 0, false
+    elseif type( first ) == 'table' then
+        local width, mt = #first, getmetatable( first )
+        local p3mt = getmetatable( point3.create( 0, 0, 0 ) )
+        if width == 0 or ( mt ~= nil and mt ~= p3mt ) then
+            return nil
+        end
+        local k = 0
+        for i = 1, n do
+            local row = t[i]
+            if type( row ) ~= 'table' or #row ~= width or getmetatable( row ) ~= mt then
+                return nil
+            end
+            for j = 1, width do
+                local v = row[j]
+                if type( v ) ~= 'number' then
+                    return nil
+                end
+                k = k + 1
+                out[k] = format( '%.17g', v )
+            end
+        end
+        return table.concat( out, ' ' ), width, mt ~= nil
+    end
+    return nil
+end
+'''
+
+_numberTypes = frozenset( [ int, long, float ] )
+_rowTypes = frozenset( [ list, tuple ] )
+
+def _numericWidth( seq ):
+
+    '''
+    Check whether a list or tuple is a homogeneous numeric sequence
+
+    @param seq (list or tuple)
+    sequence to check
+    @return (int or None)
+    0 for a flat sequence of numbers, row width for a sequence of
+    rows of numbers (ex. 3 for points, 4 for a 4x4 matrix), else None
+    '''
+
+    if not seq:
+        return None
+
+    numberTypes = _numberTypes
+    first = seq[0]
+
+    if type( first ) in numberTypes:
+        for v in seq:
+            if type( v ) not in numberTypes:
+                return None
+        return 0
+
+    if type( first ) in _rowTypes:
+        width = len( first )
+        if width == 0:
+            return None
+        for row in seq:
+            if type( row ) not in _rowTypes or len( row ) != width:
+                return None
+            for v in row:
+                if type( v ) not in numberTypes:
+                    return None
+        return width
+
+    return None
+
+def _numbersToLua( values, width = 0, asPoint3 = False ):
+
+    '''
+    Build a lua table of numbers in one lua call
+
+    @param values (iterable)
+    flat numbers, or rows of numbers if width > 0
+    @param width (int)
+    row width, 0 for a flat table
+    @param asPoint3 (bool)
+    build point3 rows (width must be 3)
+    @return (lua table)
+    '''
+
+    if width:
+        values = itertools.chain.from_iterable( values )
+
+    packed = ' '.join( [ repr( float( v ) ) for v in values ] )
+    return _luaFunction( 'unpacknumbers' )( packed, width, asPoint3 )
+
+def _numbersFromLua( packed, width, isPoint3 ):
+
+    '''
+    Decode a packed string of numbers (see packnumbers lua helper)
+
+    @return (list)
+    list of numbers, list of rows or list of Point3
+    '''
+
+    values = []
+    append = values.append
+    for token in packed.split():
+        v = float( token )
+        # same as lunatic, integral numbers are returned as long
+        append( long( v ) if v.is_integer() else v )
+
+    if width == 0:
+        return values
+    elif isPoint3:
+        return [ Point3( *values[i:i + 3] ) for i in xrange( 0, len( values ), 3 ) ]
+    else:
+        return [ values[i:i + width] for i in xrange( 0, len( values ), width ) ]
+
+# maximum nesting level of tables converted by toLua and fromLua
+MAX_CONVERSION_DEPTH = 1000
+
+# lua globals, shared by all wrappers
+_luaGlobals = lua.globals()
+# python type of lua objects (table, function, userdata...)
+_luaObjectType = type( _luaGlobals )
+
+# python types lunatic converts by itself
+_nativeTypes = set( [ int, long, float, bool, str, unicode, type( None ),
+    _luaObjectType ] )
+
+# python type -> toLua converter, see registerToLua
+_toLuaRegistry = {}
+# python type -> toLua converter, including subclasses of registered types
+_toLuaResolved = {}
+
+def registerToLua( pyType, converter ):
+
+    '''
+    Register a toLua converter for a python type
+
+    The converter is also used for subclasses of pyType unless they
+    are registered too
+
+    @param pyType (type)
+    python type
+    @param converter (callable)
+    function taking an instance of pyType and returning a lua object/value
+
+    @code
+    class Color(object):
+        def __init__(self, r, g, b):
+            self.rgb = [r, g, b]
+    registerToLua(Color, lambda c: toLua(c.rgb))
+    @endcode
+    '''
+
+    _toLuaRegistry[pyType] = converter
+    _toLuaResolved.clear()
+
+def _objectToLua( obj ):
+    return obj.__toLua__()
+
+def _mappingToLua( obj, maxDepth = None ):
+    return _containerToLua( obj, _mappingToLua, maxDepth )
+
+def _sequenceToLua( obj, maxDepth = None ):
+    return _containerToLua( obj, _sequenceToLua, maxDepth )
+
+def _luaContainer( obj, converter ):
+
+    '''
+    Create the lua table for a python container
+
+    @return (tuple)
+    lua table and iterator of (key, value) still to be converted,
+    None if the table is already filled (numeric fast path)
+    '''
+
+    if converter is _mappingToLua:
+        return lua.eval( '{}' ), obj.iteritems()
+
+    if type( obj ) in _rowTypes:
+        width = _numericWidth( obj )
+        if width is not None:
+            return _numbersToLua( obj, width ), None
+
+    # lua table starts at index 1 not 0
+    return lua.eval( '{}' ), itertools.izip( itertools.count( 1 ), obj )
+
+def _containerToLua( root, converter, maxDepth = None ):
+
+    '''
+    Convert python containers (list, tuple, dict, iterable) to lua tables
+
+    Nested containers are converted using an explicit stack. A container
+    met several times is converted once: shared items and cycles are kept.
+
+    @param root
+    python container
+    @param converter (function)
+    _mappingToLua or _sequenceToLua
+    @param maxDepth (int)
+    maximum nesting level (default: MAX_CONVERSION_DEPTH)
+    @return (lua table)
+
+    @throws (RuntimeError)
+    raise an exception if containers are nested deeper than maxDepth
+    '''
+
+    if maxDepth is None:
+        maxDepth = MAX_CONVERSION_DEPTH
+
+    luaRoot, items = _luaContainer( root, converter )
+    if items is None:
+        return luaRoot
+
+    # id(python container) -> ( python container, lua table ): containers
+    # are kept alive so that their id is not reused by a new container
+    # (ex. rows yielded by a generator)
+    memo = { id( root ): ( root, luaRoot ) }
+    stack = [ ( luaRoot, items, 1 ) ]
+
+    while stack:
+        luaTbl, items, depth = stack[-1]
+        for key, value in items:
+
+            pyType = type( value )
+            if pyType in _nativeTypes:
+                luaTbl[key] = value
+                continue
+
+            valueConverter = _toLuaConverter( pyType )
+            if valueConverter is not _mappingToLua and valueConverter is not _sequenceToLua:
+                luaTbl[key] = valueConverter( value )
+                continue
+
+            memoized = memo.get( id( value ) )
+            if memoized is None:
+                if depth >= maxDepth:
+                    raise RuntimeError( 'maximum conversion depth exceeded (%d)' % maxDepth )
+
+                child, childItems = _luaContainer( value, valueConverter )
+                memo[id( value )] = ( value, child )
+                luaTbl[key] = child
+
+                if childItems is not None:
+                    # convert child first, resume this container afterwards
+                    stack.append( ( child, childItems, depth + 1 ) )
+                    break
+            else:
+                luaTbl[key] = memoized[1]
+        else:
+            stack.pop()
+
+    return luaRoot
+
+def _nativeToLua( obj ):
+    return obj
+
+def _arrayToLua( obj ):
+
+    # 'c' and 'u' arrays are characters, not numbers
+    if obj.typecode in 'cu':
+        return _sequenceToLua( obj )
+    return _numbersToLua( obj )
+
+def _ndarrayToLua( obj ):
+
+    if obj.dtype.kind not in 'iuf' or obj.ndim not in ( 1, 2 ) or obj.size == 0:
+        return toLua( obj.tolist() )
+    elif obj.ndim == 2:
+        return _numbersToLua( obj.tolist(), obj.shape[1] )
+    else:
+        return _numbersToLua( obj.tolist() )
+
+def _toLuaConverter( pyType ):
+
+    '''
+    Find the toLua converter for a python type
+
+    @param pyType (type)
+    python type
+    @return (callable)
+    converter registered for pyType or its closest registered base class,
+    else guessed from pyType interface (__toLua__, iteritems, __iter__)
+    '''
+
+    try:
+        return _toLuaResolved[pyType]
+    except KeyError:
+        pass
+
+    for base in pyType.__mro__:
+        if base in _toLuaRegistry:
+            converter = _toLuaRegistry[base]
+            break
+    else:
+        if hasattr( pyType, '__toLua__' ):
+            converter = _objectToLua
+        elif hasattr( pyType, 'iteritems' ):
+            converter = _mappingToLua
+        elif hasattr( pyType, '__iter__' ):
+            converter = _sequenceToLua
+        else:
+            # let lunatic wrap it as userdata
+            converter = _nativeToLua
+
+    _toLuaResolved[pyType] = converter
+    return converter
+
+def toLua( obj, maxDepth = None ):
 
     '''
     Convert python 'object/value' to lua 'object/value'
     Lunatic can handle anything but python list, tuple, dict or object
 
+    @param obj
+    python object/value
+    @param maxDepth (int)
+    maximum nesting level of containers (default: MAX_CONVERSION_DEPTH)
+
     @code
     conversion process ->
-    
-    userdata:
-    * __toLua__
-    ** iteritems
-    *** iter
-    other:
-    * N/A
+
+    * number, string, bool, None, lua object
+    ** returned as is (handled by lunatic)
+    * registered python type (see registerToLua)
+    ** registered converter
+    * other:
+    ** __toLua__
+    *** iteritems
+    **** iter
+
+    containers are converted without recursion, the same container
+    is converted once (shared items and cycles are kept)
 
     @endcode
 
@@ -150,52 +556,74 @@ def toLua( obj ):
     @endcode
     '''
 
-    lg = lua.globals()
-    luaType = lg.type( obj )
-
-    if luaType == 'userdata':
-
-        try:
-            return obj.__toLua__()
-        except:
-            pass
-
-        luaTbl = lua.eval( '{}' )
-        try:
-            for k, v in obj.iteritems():
-                luaTbl[k] = toLua( v )
-            return luaTbl
-        except:
-            pass
-
-        luaTbl = lua.eval( '{}' )
-        try:
-            for i, v in enumerate( obj ):
-                luaTbl[i + 1] = toLua( v )
-            return luaTbl
-        except:
-            # raise an error?
-            pass
-
-    else:
-        # number, nil, lua table
-        # handled by lunatic
+    pyType = type( obj )
+    if pyType in _nativeTypes:
         return obj
 
-def fromLua( obj ):
+    converter = _toLuaConverter( pyType )
+    if converter is _mappingToLua or converter is _sequenceToLua:
+        return converter( obj, maxDepth )
+    return converter( obj )
+
+registerToLua( list, _sequenceToLua )
+registerToLua( tuple, _sequenceToLua )
+registerToLua( dict, _mappingToLua )
+registerToLua( array.array, _arrayToLua )
+if numpy is not None:
+    registerToLua( numpy.ndarray, _ndarrayToLua )
+
+# lua value -> class name (or lua type), True if it is a guerilla class,
+# and an identifier of plain tables (0 for other values): python str() of
+# a table is not reliable (__tostring metamethod)
+_luaSources['classify'] = '''
+( function()
+    local ids = setmetatable( {}, { __mode = 'k' } )
+    local last = 0
+    return function( v )
+        local ok, className = pcall( getclassname, v )
+        if ok and className then
+            return className, true, 0
+        end
+        local t = type( v )
+        if t ~= 'table' then
+            return t, false, 0
+        end
+        local id = ids[v]
+        if id == nil then
+            last = last + 1
+            id = last
+            ids[v] = id
+        end
+        return t, false, id
+    end
+end )()
+'''
+
+def fromLua( obj, lazy = False, maxDepth = None ):
 
     '''
     Convert lua 'object/value' to python 'object/value'
 
+    @param obj
+    lua object/value
+    @param lazy (bool)
+    if True, lua tables are returned as read-only LuaDict/LuaList views
+    converting their elements on access
+    @param maxDepth (int)
+    maximum nesting level of tables (default: MAX_CONVERSION_DEPTH)
+
     @code
     conversion process ->
     * lua class
     **__fromLua__
     * lua table
     ** len == 0
-    *** to python dict
+    *** to python dict (LuaDict if lazy)
     ** len > 0
-    ** to python list
+    ** to python list (LuaList if lazy)
+
+    tables are converted without recursion, the same table
+    is converted once (shared items and cycles are kept)
     @endcode
 
     @note
@@ -246,11 +674,602 @@ def fromLua( obj ):
     >>> print fromLua(Point3(1, 2, 3)); print Point3(1, 2, 3) # doctest: +ELLIPSIS
     <pyGuerilla.Point3 object at ...>
 
+    >>> prefs = fromLua(lua.eval('{a={1, 2}, b=2}'), lazy=True); prefs['a'][1]
+    2L
+
+    @endcode
+    '''
+
+    if type( obj ) is not _luaObjectType:
+        # number, string, bool, None
+        # handled by lunatic
+        return obj
+
+    name, isClass = _luaFunction( 'classify' )( obj )[:2]
+
+    if isClass:
+        return _wrapperClass( name ).__fromLua__( obj )
+    elif name != 'table':
+        # function, userdata...
+        return obj
+    elif lazy:
+        return LuaDict( obj ) if len( obj ) == 0 else LuaList( obj )
+    else:
+        return _tableFromLua( obj, maxDepth )
+
+def _pyContainer( luaTbl ):
+
+    '''
+    Create the python container for a lua table
+
+    @return (tuple)
+    python dict or list, index offset between lua keys and python keys
+    (0 for a dict) and iterator of lua keys still to be converted, None if the container
+    is already filled (numeric fast path)
+    '''
+
+    # XXX fromLua for keys too?
+    # tips: len is always 0 for a dict (in lua)
+    size = len( luaTbl )
+    if size == 0:
+        return {}, 0, iter( list( luaTbl ) )
+
+    # numbers, points or matrix: read the whole table at once
+    packed = _luaFunction( 'packnumbers' )( luaTbl )
+    if packed is not None:
+        return _numbersFromLua( *packed ), 0, None
+
+    # lua table starts at index 1 not 0
+    return [ None ] * size, 1, iter( xrange( 1, size + 1 ) )
+
+def _tableFromLua( root, maxDepth = None ):
+
+    '''
+    Convert a lua table to python dict or list
+
+    Nested tables are converted using an explicit stack. A table met
+    several times is converted once: shared items and cycles are kept.
+
+    @param root (lua table)
+    @param maxDepth (int)
+    maximum nesting level (default: MAX_CONVERSION_DEPTH)
+    @return (dict or list)
+
+    @throws (RuntimeError)
+    raise an exception if tables are nested deeper than maxDepth
+    '''
+
+    if maxDepth is None:
+        maxDepth = MAX_CONVERSION_DEPTH
+
+    classify = _luaFunction( 'classify' )
+
+    result, offset, keys = _pyContainer( root )
+    if keys is None:
+        return result
+
+    # classify table identifier -> python container
+    memo = { classify( root )[2]: result }
+    stack = [ ( result, root, offset, keys, 1 ) ]
+
+    while stack:
+        container, luaTbl, offset, keys, depth = stack[-1]
+        for key in keys:
+
+            value = luaTbl[key]
+            if offset:
+                key -= offset
+            if type( value ) is not _luaObjectType:
+                container[key] = value
+                continue
+
+            name, isClass, ident = classify( value )
+            if isClass:
+                container[key] = _wrapperClass( name ).__fromLua__( value )
+                continue
+            elif name != 'table':
+                container[key] = value
+                continue
+
+            child = memo.get( ident )
+            if child is None:
+                if depth >= maxDepth:
+                    raise RuntimeError( 'maximum conversion depth exceeded (%d)' % maxDepth )
+
+                child, childOffset, childKeys = _pyContainer( value )
+                memo[ident] = child
+                container[key] = child
+
+                if childKeys is not None:
+                    # convert child first, resume this table afterwards
+                    stack.append( ( child, value, childOffset, childKeys, depth + 1 ) )
+                    break
+            else:
+                container[key] = child
+        else:
+            stack.pop()
+
+    return result
+
+
+class LuaDict( collections.Mapping ):
+
+    '''
+    Read-only dict view over a lua table (see fromLua lazy mode)
+
+    Values are converted when accessed and cached,
+    nested tables are returned as views too
+
+    Examples:
+
+    @code
+    prefs = fromLua(lua.globals().getpreferences(), lazy=True)
     @endcode
     '''
 
-    # FIXME: Document should derived from Node
-    orderedClassKeys = [ 'Document', 'Node', 'Plug', 'point3' ]
+    def __init__( self, luaTable ):
+
+        self._table = luaTable
+        # key -> converted value
+        self._values = {}
+        self._keys = None
+
+    def __getitem__( self, key ):
+
+        try:
+            return self._values[key]
+        except KeyError:
+            pass
+
+        value = self._table[key]
+        if value is None:
+            raise KeyError( key )
+
+        value = self._values[key] = fromLua( value, lazy = True )
+        return value
+
+    def __contains__( self, key ):
+        return key in self._values or self._table[key] is not None
+
+    def __iter__( self ):
+        return iter( self.keys() )
+
+    def __len__( self ):
+        return len( self.keys() )
+
+    def keys( self ):
+
+        # lua table iteration returns keys
+        if self._keys is None:
+            self._keys = list( self._table )
+        return list( self._keys )
+
+    def __toLua__( self ):
+        return self._table
+
+
+class LuaList( collections.Sequence ):
+
+    '''
+    Read-only list view over a lua table (see fromLua lazy mode)
+
+    Items are converted when accessed and cached,
+    nested tables are returned as views too
+    '''
+
+    _missing = object()
+
+    def __init__( self, luaTable ):
+
+        self._table = luaTable
+        self._items = [ LuaList._missing ] * len( luaTable )
+
+    def __getitem__( self, index ):
+
+        if isinstance( index, slice ):
+            return [ self[i] for i in xrange( *index.indices( len( self._items ) ) ) ]
+
+        item = self._items[index]
+        if item is LuaList._missing:
+            if index < 0:
+                index += len( self._items )
+            # lua table starts at index 1 not 0
+            item = self._items[index] = fromLua( self._table[index + 1], lazy = True )
+        return item
+
+    def __len__( self ):
+        return len( self._items )
+
+    def __eq__( self, other ):
+
+        if isinstance( other, ( list, LuaList ) ):
+            return list( self ) == list( other )
+        return NotImplemented
+
+    def __ne__( self, other ):
+
+        equal = self.__eq__( other )
+        return equal if equal is NotImplemented else not equal
+
+    def __toLua__( self ):
+        return self._table
+
+
+class _NodeCache( object ):
+
+    '''
+    Node instances by lua node id (weak references)
+
+    Deleted nodes are forgotten when deleted through a ModificationContext,
+    everything is forgotten on Document.new and Document.load
+    '''
+
+    def __init__( self ):
+        self._byId = weakref.WeakValueDictionary()
+
+    def byId( self, nodeId ):
+        return self._byId.get( nodeId )
+
+    def addId( self, nodeId, node ):
+        self._byId[nodeId] = node
+
+    def forget( self, node ):
+
+        '''
+        Forget a (deleted) node
+        '''
+
+        nodeId = getattr( node, '_id', None )
+        if nodeId is not None:
+            self._byId.pop( nodeId, None )
+
+    def clearAttrs( self ):
+
+        '''
+        Forget resolved plugs and children of all nodes
+        '''
+
+        for node in self._byId.values():
+            node._attrCache.clear()
+
+    def clear( self ):
+        self._byId.clear()
+
+_nodeCache = _NodeCache()
+
+class _SceneIndex( object ):
+
+    '''
+    Sorted long names and class names of all the document nodes
+    (see Document.find)
+
+    Built on first query, kept up to date by ModificationContext node
+    create, rename, move and delete, rebuilt after batches, references
+    and file loading, and by Document.find when a path does not resolve
+    '''
+
+    def __init__( self ):
+
+        self._paths = None
+        self._classes = {}
+        # ( class name, type ) -> class name derives from type
+        self._derived = {}
+
+    @property
+    def built( self ):
+        return self._paths is not None
+
+    def clear( self ):
+
+        self._paths = None
+        self._classes = {}
+
+    def _build( self ):
+
+        paths, classes = _luaFunction( 'scenepaths' )( lua.globals().Document )
+        paths = paths.split( '\n' ) if paths else []
+        classes = classes.split( '\n' ) if classes else []
+
+        self._classes = dict( itertools.izip( paths, classes ) )
+        self._paths = sorted( paths )
+
+    def _range( self, prefix ):
+
+        '''
+        Slice of sorted paths starting with prefix
+        '''
+
+        paths = self._paths
+        lo = hi = bisect.bisect_left( paths, prefix )
+        size = len( paths )
+        while hi < size and paths[hi].startswith( prefix ):
+            hi += 1
+        return lo, hi
+
+    def _isA( self, className, type ):
+
+        key = ( className, type )
+        derived = self._derived.get( key )
+        if derived is None:
+            derived = self._derived[key] = bool( lua.globals().classisclassof( className, type ) )
+        return derived
+
+    def add( self, path, className ):
+
+        if self._paths is None:
+            return
+
+        bisect.insort( self._paths, path )
+        self._classes[path] = className
+
+    def remove( self, path ):
+
+        '''
+        Remove path and its descendants
+
+        @return (dict)
+        removed path -> class name
+        '''
+
+        if self._paths is None:
+            return {}
+
+        paths = self._paths
+        removed = {}
+
+        lo, hi = self._range( path + '|' )
+        for p in paths[lo:hi]:
+            removed[p] = self._classes.pop( p )
+        del paths[lo:hi]
+
+        i = bisect.bisect_left( paths, path )
+        if i < len( paths ) and paths[i] == path:
+            removed[path] = self._classes.pop( path )
+            del paths[i]
+
+        return removed
+
+    def move( self, oldPath, newPath ):
+
+        '''
+        Rename path and its descendants
+        '''
+
+        if self._paths is None or oldPath == newPath:
+            return
+
+        size = len( oldPath )
+        for p, className in self.remove( oldPath ).iteritems():
+            p = newPath + p[size:]
+            self._paths.append( p )
+            self._classes[p] = className
+        self._paths.sort()
+
+    def find( self, pattern, type = None, regex = False ):
+
+        '''
+        Long names matching pattern (see Document.find)
+        '''
+
+        if self._paths is None:
+            self._build()
+
+        if regex:
+            match = re.compile( pattern ).match
+            candidates = self._paths
+        else:
+            # only paths starting with the pattern literal prefix may match
+            prefix = re.split( r'[*?\[]', pattern, 1 )[0]
+            lo, hi = self._range( prefix )
+            candidates = self._paths[lo:hi]
+            if prefix == pattern:
+                match = pattern.__eq__
+            else:
+                match = re.compile( fnmatch.translate( pattern ) ).match
+
+        classes = self._classes
+        return [ p for p in candidates
+                if match( p ) and ( type is None or self._isA( classes[p], type ) ) ]
+
+_sceneIndex = _SceneIndex()
+
+# number of nodes transferred per lua call by walk
+WALK_CHUNK_SIZE = 1000
+
+def _walk( luaRoot, type, maxDepth, prune, order ):
+
+    '''
+    Iterator over the nodes below a lua node (see Document.walk)
+
+    Not a generator: arguments are checked when called
+    '''
+
+    if order not in ( 'bfs', 'dfs' ):
+        raise ValueError( "order should be 'bfs' or 'dfs', not %r" % ( order, ) )
+
+    step = _luaFunction( 'walker' )( luaRoot, type,
+            -1 if maxDepth is None else maxDepth, order == 'dfs',
+            prune is not None, _luaFunction( 'nodeinfo' ) )
+    return _walkChunks( step, prune )
+
+def _walkChunks( step, prune ):
+
+    '''
+    Nodes returned by a lua walker, chunk by chunk (see _walk)
+    '''
+
+    cuts = ''
+    while True:
+        luaNodes, infos, paths = step( WALK_CHUNK_SIZE, cuts )
+        infos = infos.split()
+        if not infos:
+            return
+
+        if prune is not None:
+            paths = paths.split( '\n' )
+            # pruned nodes of this chunk and their descendants
+            skipped = set()
+            cuts = []
+
+        for i in xrange( len( infos ) / 3 ):
+            if prune is not None:
+                path = paths[i]
+                if path.rpartition( '|' )[0] in skipped:
+                    skipped.add( path )
+                    cuts.append( str( i + 1 ) )
+                    continue
+                if prune( path ):
+                    skipped.add( path )
+                    cuts.append( str( i + 1 ) )
+                if infos[3 * i + 2] == '0':
+                    continue
+            yield Node._wrap( luaNodes[i + 1], infos[3 * i + 1], int( infos[3 * i] ) )
+
+        if prune is not None:
+            cuts = ' '.join( cuts )
+
+def _plugClosure( plugs, upstream, depth ):
+
+    '''
+    Plugs reachable from plugs (see Plug.upstream)
+    '''
+
+    result = _luaFunction( 'plugclosure' )( toLua( [ p._plug for p in plugs ] ), upstream,
+            -1 if depth is None else depth, None, None )
+    return [ Plug.fromHandle( result[i] ) for i in xrange( 1, len( result ) + 1 ) ]
+
+def _nodeClosure( node, upstream, depth ):
+
+    '''
+    Nodes reachable from node plugs (see Node.upstream)
+    '''
+
+    return _wrapNodes( _luaFunction( 'plugclosure' )( None, upstream,
+            -1 if depth is None else depth, node._node, _luaFunction( 'refusedkeys' ) ) )
+
+def _samplePlugs( plugs, frames ):
+
+    '''
+    Values of plugs at each frame (see Document.sample)
+    '''
+
+    plugs, frames = list( plugs ), list( frames )
+    if not plugs or not frames:
+        rows = [ [] for f in frames ]
+    else:
+        # recorded values are not applied yet
+        contexts = _openContexts.contexts
+        if contexts:
+            contexts[-1].flush()
+
+        # Time is not set in a modification, whose changes are only
+        # evaluated once finished
+        luaRows, nils = _luaFunction( 'sampleplugs' )( lua.globals().Document,
+                toLua( plugs ), len( plugs ), toLua( frames ) )
+        rows = fromLua( luaRows )
+        for line in nils.splitlines():
+            i, j = line.split()
+            rows[int( i ) - 1][int( j ) - 1] = None
+
+    if numpy is not None and ( not rows or _numericWidth( rows ) == len( plugs ) ):
+        return numpy.array( rows, dtype = numpy.float64 ).reshape( len( frames ), len( plugs ) )
+    return rows
+
+def _forgetAttrs( node ):
+
+    '''
+    Forget resolved plugs and children of node (Node.__getattr__)
+
+    @param node (Node, Document or None)
+    '''
+
+    attrs = getattr( node, '_attrCache', None )
+    if attrs is not None:
+        attrs.clear()
+
+def _nodesAtPaths( paths ):
+
+    '''
+    Get the Node at each path in a single lua call
+
+    @param paths (list - str)
+    node long names
+    @return (list - Node)
+    Node, None for paths that do not resolve
+    '''
+
+    if not paths:
+        return []
+
+    nodes, infos = _luaFunction( 'findnodes' )( toLua( paths ), len( paths ),
+            _luaFunction( 'nodeinfo' ) )
+    infos = infos.split()
+
+    result = []
+    for i in xrange( len( paths ) ):
+        nodeId = int( infos[2 * i] )
+        node = None
+        if nodeId:
+            node = _nodeCache.byId( nodeId )
+            if node is None:
+                node = Node._wrap( nodes[i + 1], infos[2 * i + 1], nodeId )
+        result.append( node )
+
+    return result
+
+def _wrapNodes( luaNodes ):
+
+    '''
+    Get the Node of each lua node in a table
+
+    @param luaNodes (lua table)
+    array or dict of lua nodes
+    @return (list - Node)
+    '''
+
+    nodes, infos = _luaFunction( 'nodelist' )( luaNodes, _luaFunction( 'nodeinfo' ) )
+    infos = infos.split()
+
+    result = []
+    for i in xrange( 0, len( infos ), 2 ):
+        nodeId = int( infos[i] )
+        node = _nodeCache.byId( nodeId )
+        if node is None:
+            node = Node._wrap( nodes[i / 2 + 1], infos[i + 1], nodeId )
+        result.append( node )
+
+    return result
+
+
+# FIXME: Document should derived from Node
+_orderedClassKeys = [ 'Document', 'Node', 'Plug', 'point3' ]
+
+# lua class name -> python wrapper class, see _wrapperClass
+# cleared by Document.new and Document.load (see _resetSession)
+_classCache = {}
+
+def _wrapperClass( className ):
+
+    '''
+    Find the python wrapper class for a lua class name
+
+    The result is cached per session so converting many objects of
+    the same lua class only costs one getclassname call each
+
+    @param className (str)
+    lua class name, ex: SceneGraphNode
+    @return (class)
+    Document, Node, Plug or Point3
+
+    @throws (RuntimeError)
+    raise an exception if className does not derive from a wrapped class
+    '''
+
+    try:
+        return _classCache[className]
+    except KeyError:
+        pass
+
     classMap = {
             'Document': Document,
             'Node': Node,
@@ -259,34 +1278,36 @@ def fromLua( obj ):
             }
 
     lg = lua.globals()
-    luaType = lg.type( obj )
+    for c in _orderedClassKeys:
+        if lg.classisclassof( className, c ):
+            _classCache[className] = classMap[c]
+            return classMap[c]
 
-    className = None
-    try:
-        className = lg.getclassname( obj )
-    except Exception:
-        pass
+    raise RuntimeError( 'Unable to find base class for %s' % className )
 
-    if className:
-        for c in orderedClassKeys:
-            if lg.classisclassof( className, c ):
-                return classMap[c].__fromLua__( obj )
+def _resetSession():
 
-        raise RuntimeError( 'Unable to find base class for %s' % className )
-    else:
-        if luaType == 'table':
+    '''
+    Clear all per session caches
 
-            # XXX fromLua for keys too?
-            # tips: len is always 0 for a dict (in lua)
-            if len( obj ) == 0:
-                return dict( ( k, fromLua( obj[k] ) ) for k in obj )
-            else:
-                # lua table starts at index 1 not 0
-                return [fromLua( obj[i + 1] ) for i in xrange( len( obj ) )]
-        else:
-            # number, nil
-            # handled by lunatic
-            return obj
+    Called whenever the current document is replaced (new or load)
+    '''
+
+    _classCache.clear()
+    _nodeCache.clear()
+    _sceneIndex.clear()
+
+
+class _ModificationContextStack( threading.local ):
+
+    '''
+    Modification contexts opened with the 'with' statement (innermost last)
+    '''
+
+    def __init__( self ):
+        self.contexts = []
+
+_openContexts = _ModificationContextStack()
 
 
 class ModificationContext( object ):
@@ -307,17 +1328,40 @@ class ModificationContext( object ):
     # retrieve current modification context
     m = ModificationContext.get()
     @endcode
+
+    @code
+    # batch mode: operations are applied in one lua call when leaving the block
+    with ModificationContext(batch=True) as m:
+        grp = m.createNode('grp')
+        t = m.createNode('xform', 'TransformEuler', grp)
+        m.connect(grp.Transform, t.Out)
+    # created nodes are available once the context is flushed
+    print grp.node.longName
+    @endcode
+
+    @note
+    inside a 'with' block, get (and all Node/Plug convenience methods)
+    reuse the innermost opened context
     '''
 
-    def __init__( self ):
+    def __init__( self, batch = False ):
 
         '''
         Modification context constructor
+
+        @param batch (bool)
+        if True, record operations and apply them all at once when
+        leaving the 'with' block (or on flush). createNode and createPlug
+        return PendingNode and PendingPlug handles, resolved after flush
         '''
 
         self._luaGlobals = lua.globals()
         # Document instance
         self.doc = Document( self._luaGlobals )
+        self.batch = batch
+        # recorded operations (batch mode), see flush
+        self._ops = []
+        self._pendingCount = 0
 
     def __enter__( self ):
 
@@ -329,6 +1373,7 @@ class ModificationContext( object ):
 
         luaDoc = self.doc._doc
         self._mod = luaDoc.modify( luaDoc )
+        _openContexts.contexts.append( self )
         return self
 
     def __exit__( self, type, value, traceback ):
@@ -339,7 +1384,14 @@ class ModificationContext( object ):
         Required to support 'with' statement
         '''
 
-        self._mod.finish()
+        _openContexts.contexts.remove( self )
+        try:
+            # do not apply a partial batch
+            if type is None:
+                self.flush()
+        finally:
+            self._ops = []
+            self._mod.finish()
 
     def __toLua__( self ):
         '''
@@ -357,6 +1409,57 @@ class ModificationContext( object ):
         '''
         return ModificationContext.get()
 
+    def _record( self, *op ):
+
+        '''
+        Record an operation (batch mode), see flush
+        '''
+
+        self._ops.append( op )
+
+    def flush( self ):
+
+        '''
+        Apply recorded operations (batch mode) in a single lua call
+
+        Called when leaving the 'with' block, call it explicitly
+        to resolve pending handles inside the block
+
+        @throws (RuntimeError)
+        raise an exception if an operation fails (ex. unknown node type),
+        operations recorded before the failing one are applied
+        '''
+
+        if not self._ops:
+            return
+
+        ops = self._ops
+        pending = [ op[-1] for op in ops if op[0] == 'createnode' ]
+        self._ops = []
+
+        # deleted nodes
+        opNames = set( op[0] for op in ops )
+        if 'deletenode' in opNames:
+            for op in ops:
+                if op[0] == 'deletenode':
+                    _nodeCache.forget( op[1] )
+
+        # plugs or children changed
+        if opNames & set( ( 'createnode', 'createplug', 'deleteplug', 'renamenode', 'movenode', 'deletenode' ) ):
+            _nodeCache.clearAttrs()
+
+        if opNames & set( ( 'createnode', 'renamenode', 'movenode', 'deletenode' ) ):
+            _sceneIndex.clear()
+
+        try:
+            created, ids, kinds = _luaFunction( 'applyops' )( self._mod, self.doc._doc,
+                    toLua( ops ), _luaFunction( 'nodeinfo' ) )
+        except Exception as e:
+            raise RuntimeError( 'batch modification failed: %s' % e )
+
+        for p in pending:
+            p._created = ( created, ids, kinds )
+
     def createNode( self, name, type = 'SceneGraphNode', parent = None ):
 
         '''
@@ -369,22 +1472,422 @@ class ModificationContext( object ):
         @param parent (Node)
         parent node (default: current Document)
         @return (Node)
-        created node
+        created node (PendingNode in batch mode)
+
+        @todo
+        error if trying to create a ArchReference, SystemCamera
+        '''
+
+        if self.batch:
+            self._pendingCount += 1
+            pending = PendingNode( self._pendingCount, name )
+            self._record( 'createnode', parent, type, name, pending )
+            return pending
+
+        if parent is None:
+            luaParent = self.doc._doc
+        else:
+            luaParent = toLua( parent )
+
+        if self._luaGlobals.isclass( type ) == False:
+            raise ValueError( 'not a valid node type: %s' % type )
+
+        luaNode = self._mod.createnode( luaParent, type, name )
+        _forgetAttrs( parent )
+        node = Node._wrap( luaNode )
+        if _sceneIndex.built:
+            _sceneIndex.add( node.longName, type )
+        return node
+
+    def createNodes( self, spec, parent = None ):
+
+        '''
+        Create nodes, their plugs and connections from a declarative spec
+
+        All nodes, plugs and connections are created in one pass
+        (a single lua call, see batch mode)
+
+        @param spec (dict or list - dict)
+        node description(s):
+        - name (str): node name
+        - type (str): node type (default: SceneGraphNode)
+        - plugs (dict): plug name -> value. A Gtypes value creates a dynamic
+        plug of that type (initialized with Gtypes value)
+        - children (list - dict): child node descriptions
+        - connections (list - tuple): (input plug, output plug) pairs; a plug is
+        a Plug or a 'path.PlugName' string, path being a key of the returned
+        dict or the long name of an existing node
+        @param parent (Node)
+        parent of the top nodes (default: current Document)
+        @return (dict)
+        path relative to parent -> created Node (PendingNode in batch mode)
+
+        @throws (RuntimeError)
+        raise an exception if a node spec has no name (the message gives
+        its index in the list) or if a node or plug could not be created
+
+        @code
+        with ModificationContext() as m:
+            nodes = m.createNodes({'name': 'grp', 'children': [
+                {'name': 'xform', 'type': 'TransformEuler', 'plugs': {'TY': 2.0}},
+                {'name': 'geo', 'plugs': {'tag': Gtypes('string', 'hero')}},
+                ],
+                'connections': [('grp.Transform', 'grp|xform.Out')],
+                })
+            print nodes['grp|xform'].longName
+        @endcode
+        '''
+
+        wasBatch = self.batch
+        self.batch = True
+        recorded = len( self._ops )
+        try:
+            nodes = self._recordSpec( spec, parent )
+        except Exception:
+            # do not leave a partial spec to be applied by flush
+            del self._ops[recorded:]
+            raise
+        finally:
+            self.batch = wasBatch
+
+        if wasBatch:
+            return nodes
+
+        self.flush()
+        return dict( ( path, pending.node ) for path, pending in nodes.iteritems() )
+
+    def _recordSpec( self, spec, parent ):
+
+        '''
+        Record operations for createNodes spec (batch mode)
+
+        @return (dict)
+        path relative to parent -> PendingNode
+        '''
+
+        nodes = {}
+        plugs = []
+        connections = []
+
+        specs = [ ( s, i, parent, '' ) for i, s in
+                enumerate( spec if isinstance( spec, ( list, tuple ) ) else [ spec ] ) ]
+        # depth first, in spec order
+        specs.reverse()
+        while specs:
+            nodeSpec, index, nodeParent, parentPath = specs.pop()
+            if not isinstance( nodeSpec, dict ) or 'name' not in nodeSpec:
+                raise RuntimeError( "invalid node spec %d%s: a dict with a 'name' is required, got %r"
+                        % ( index, " in '%s' children" % parentPath if parentPath else '', nodeSpec ) )
+            name = nodeSpec['name']
+            path = '%s|%s' % ( parentPath, name ) if parentPath else name
+
+            node = nodes[path] = self.createNode( name, nodeSpec.get( 'type', 'SceneGraphNode' ), nodeParent )
+            plugs.extend( ( node, k, v ) for k, v in nodeSpec.get( 'plugs', {} ).iteritems() )
+            connections.extend( nodeSpec.get( 'connections', [] ) )
+            specs.extend( reversed( [ ( c, i, node, path )
+                    for i, c in enumerate( nodeSpec.get( 'children', [] ) ) ] ) )
+
+        for node, plugName, value in plugs:
+            if isinstance( value, Gtypes ):
+                self.createPlug( node, plugName, dataType = value )
+            else:
+                self.setPlug( PendingPlug( node, plugName ), value )
+
+        def plug( p ):
+            if not isinstance( p, basestring ):
+                return p
+            nodePath, plugName = p.rsplit( '.', 1 )
+            node = nodes.get( nodePath )
+            if node is None:
+                return Plug( plugName, Node( nodePath ) )
+            return PendingPlug( node, plugName )
+
+        for inputPlug, outputPlug in connections:
+            self.connect( plug( inputPlug ), plug( outputPlug ) )
+
+        return nodes
+
+    def reconcile( self, target, root ):
+
+        '''
+        Edit the nodes below root to match a declarative description
+
+        Only the necessary operations are issued, in one pass (batch mode):
+        live nodes are matched to the description by path, then by name and
+        type anywhere below root (moved), then by type among the remaining
+        children of the same parent (renamed); unmatched descriptions are
+        created and unmatched live nodes deleted
+
+        Plugs and connections that are not described are left untouched
+
+        @param target (dict or list - dict)
+        description of root children, see createNodes; an output plug
+        set to None in connections disconnects the input plug
+        @param root (Node)
+        node to reconcile
+        @return (list - tuple)
+        issued edits, paths relative to root:
+        - ( 'createNode', path, type )
+        - ( 'moveNode', old path, new path )
+        - ( 'renameNode', old path, new path )
+        - ( 'deleteNode', path )
+        - ( 'createPlug', 'path.Plug', Gtypes )
+        - ( 'setPlug', 'path.Plug', value )
+        - ( 'connect', 'path.Plug', output plug ) / ( 'disconnect', 'path.Plug', output plug )
+
+        @throws (RuntimeError)
+        raise an exception if an operation fails
 
-        @todo
-        error if trying to create a ArchReference, SystemCamera
+        @code
+        with ModificationContext() as m:
+            edits = m.reconcile([{'name': 'xform', 'type': 'TransformEuler', 'plugs': {'TY': 2.0}}],
+                Node('asset'))
+        @endcode
         '''
 
-        if parent is None:
-            luaParent = self.doc._doc
-        else:
-            luaParent = parent._node
+        prefix = root.longName + '|'
+
+        # live hierarchy, path relative to root -> class name
+        paths, classes = _luaFunction( 'scenepaths' )( root._node )
+        live = dict( itertools.izip( [ p[len( prefix ):] for p in paths.split( '\n' ) ] if paths else [],
+                classes.split( '\n' ) if classes else [] ) )
+
+        liveChildren = collections.defaultdict( list )
+        liveByKey = collections.defaultdict( list )
+        for path in sorted( live ):
+            parentPath, _, name = path.rpartition( '|' )
+            liveChildren[parentPath].append( path )
+            liveByKey[( name, live[path] )].append( path )
+
+        # described nodes, top down: path, parent path, description
+        nodes = []
+        queue = collections.deque( ( s, '' ) for s in ( target if isinstance( target, ( list, tuple ) ) else [ target ] ) )
+        while queue:
+            nodeSpec, parentPath = queue.popleft()
+            path = '%s|%s' % ( parentPath, nodeSpec['name'] ) if parentPath else nodeSpec['name']
+            nodes.append( ( path, parentPath, nodeSpec ) )
+            queue.extend( ( c, path ) for c in nodeSpec.get( 'children', [] ) )
+
+        specNames = collections.defaultdict( set )
+        for path, parentPath, nodeSpec in nodes:
+            specNames[parentPath].add( nodeSpec['name'] )
+
+        def nodeType( nodeSpec ):
+            return nodeSpec.get( 'type', 'SceneGraphNode' )
+
+        def childPath( parentPath, name ):
+            return '%s|%s' % ( parentPath, name ) if parentPath else name
+
+        # described path -> live path (None for created nodes)
+        match = { '': '' }
+        claimed = set()
+
+        def claim( path, livePath ):
+            match[path] = livePath
+            claimed.add( livePath )
+
+        # same path, through parents at the same path
+        for path, parentPath, nodeSpec in nodes:
+            if match.get( parentPath ) == parentPath and live.get( path ) == nodeType( nodeSpec ):
+                claim( path, path )
+
+        def sameName( path, nodeSpec ):
+            # same name under a moved or renamed parent
+            parentLive = match.get( path.rpartition( '|' )[0] )
+            if parentLive is None:
+                return False
+            livePath = childPath( parentLive, nodeSpec['name'] )
+            if livePath in claimed or live.get( livePath ) != nodeType( nodeSpec ):
+                return False
+            claim( path, livePath )
+            return True
 
-        if self._luaGlobals.isclass( type ) == False:
-            raise ValueError( 'not a valid node type: %s' % type )
+        # same name and type anywhere below root
+        moved = []
+        for path, parentPath, nodeSpec in nodes:
+            if path in match or sameName( path, nodeSpec ):
+                continue
 
-        luaNode = self._mod.createnode( luaParent, type, name )
-        return Node( str( luaNode ) )
+            # closest matched ancestor, a node cannot be moved below itself
+            anchor = parentPath
+            while match.get( anchor ) is None:
+                anchor = anchor.rpartition( '|' )[0]
+            anchor = match[anchor]
+
+            livePath = next( ( p for p in liveByKey[( nodeSpec['name'], nodeType( nodeSpec ) )]
+                    if p not in claimed and anchor != p and not anchor.startswith( p + '|' ) ), None )
+            if livePath is not None:
+                claim( path, livePath )
+                moved.append( path )
+
+        # same type among the parent children, else created
+        renamed, created = [], []
+        for path, parentPath, nodeSpec in nodes:
+            if path in match or sameName( path, nodeSpec ):
+                continue
+
+            parentLive = match[parentPath]
+            if parentLive is not None:
+                livePath = next( ( p for p in liveChildren[parentLive] if p not in claimed
+                        and live[p] == nodeType( nodeSpec )
+                        and p.rpartition( '|' )[2] not in specNames[parentPath] ), None )
+                if livePath is not None:
+                    claim( path, livePath )
+                    renamed.append( path )
+                    continue
+
+            match[path] = None
+            created.append( path )
+
+        # parent renamed instead of moved
+        moved = [ path for path in moved
+                if match[path.rpartition( '|' )[0]] != match[path].rpartition( '|' )[0] ]
+
+        def liveNode( livePath ):
+            return Node( prefix + livePath ) if livePath else root
+
+        # described path -> Node or PendingNode
+        handles = dict( ( path, liveNode( livePath ) ) for path, livePath in match.iteritems()
+                if livePath is not None )
+        specs = dict( ( path, nodeSpec ) for path, parentPath, nodeSpec in nodes )
+
+        edits = []
+        # nodes created or moved where a live node (deleted or renamed later) has the same name
+        collisions = []
+
+        wasBatch = self.batch
+        self.batch = True
+        try:
+            for path in created:
+                parentPath, _, name = path.rpartition( '|' )
+                type = nodeType( specs[path] )
+                handles[path] = self.createNode( name, type, handles[parentPath] )
+                edits.append( ( 'createNode', path, type ) )
+                if match[parentPath] is not None and childPath( match[parentPath], name ) in live:
+                    collisions.append( path )
+
+            for path in moved:
+                parentPath, _, name = path.rpartition( '|' )
+                self.moveNode( handles[path], handles[parentPath] )
+                edits.append( ( 'moveNode', match[path], path ) )
+                if match[parentPath] is not None and childPath( match[parentPath], name ) in live:
+                    collisions.append( path )
+
+            kept = claimed | set( [ '' ] )
+            for livePath in sorted( live ):
+                if livePath not in claimed and livePath.rpartition( '|' )[0] in kept:
+                    self.deleteNode( liveNode( livePath ) )
+                    edits.append( ( 'deleteNode', livePath ) )
+
+            for path in renamed:
+                self.renameNode( handles[path], specs[path]['name'] )
+                edits.append( ( 'renameNode', match[path], path ) )
+
+            for path in collisions:
+                self.renameNode( handles[path], specs[path]['name'] )
+
+            self._reconcilePlugs( nodes, match, handles, prefix, edits )
+        finally:
+            self.batch = wasBatch
+
+        if not wasBatch:
+            self.flush()
+
+        return edits
+
+    def _reconcilePlugs( self, nodes, match, handles, prefix, edits ):
+
+        '''
+        Record plug and connection edits for reconcile (batch mode)
+        '''
+
+        def plug( p ):
+            if not isinstance( p, basestring ):
+                return p
+            nodePath, plugName = p.rsplit( '.', 1 )
+            node = handles.get( nodePath )
+            if node is None:
+                return Plug( plugName, Node( nodePath ) )
+            return PendingPlug( node, plugName )
+
+        def longName( p ):
+            # long name of a plug before edits, None for a created node plug
+            if not isinstance( p, basestring ):
+                return '%s.%s' % ( p.parent.longName, p.name )
+            nodePath, plugName = p.rsplit( '.', 1 )
+            if nodePath not in match:
+                return p
+            if match[nodePath] is None:
+                return None
+            return '%s%s.%s' % ( prefix, match[nodePath], plugName )
+
+        connections = []
+        for path, parentPath, nodeSpec in nodes:
+            connections.extend( nodeSpec.get( 'connections', [] ) )
+
+        # live values and inputs of described plugs of matched nodes
+        names = collections.defaultdict( set )
+        for path, parentPath, nodeSpec in nodes:
+            if match[path] is not None:
+                names[path].update( nodeSpec.get( 'plugs', {} ) )
+        for inputPlug, outputPlug in connections:
+            if isinstance( inputPlug, basestring ):
+                nodePath, plugName = inputPlug.rsplit( '.', 1 )
+                if match.get( nodePath ) is not None:
+                    names[nodePath].add( plugName )
+
+        paths = sorted( names )
+        values, inputs = {}, {}
+        if paths:
+            luaValues, nils, luaInputs = _luaFunction( 'plugstate' )(
+                    toLua( [ handles[p] for p in paths ] ),
+                    toLua( [ sorted( names[p] ) for p in paths ] ) )
+            for path, nodeValues in itertools.izip( paths, fromLua( luaValues ) ):
+                for name, value in nodeValues.iteritems():
+                    values[( path, name )] = value
+            for line in nils.splitlines():
+                index, name = line.split( '\t' )
+                values[( paths[int( index ) - 1], name )] = None
+            for line in luaInputs.splitlines():
+                index, name, output = line.split( '\t' )
+                inputs[( paths[int( index ) - 1], name )] = output
+
+        for path, parentPath, nodeSpec in nodes:
+            for name, value in sorted( nodeSpec.get( 'plugs', {} ).iteritems() ):
+                key = ( path, name )
+                plugPath = '%s.%s' % key
+                if isinstance( value, Gtypes ):
+                    if key in values:
+                        if value.value is None or _sameValue( values[key], value.value ):
+                            continue
+                        self.setPlug( PendingPlug( handles[path], name ), value.value )
+                        edits.append( ( 'setPlug', plugPath, value.value ) )
+                    else:
+                        self.createPlug( handles[path], name, dataType = value )
+                        edits.append( ( 'createPlug', plugPath, value ) )
+                elif key not in values or not _sameValue( values[key], value ):
+                    self.setPlug( PendingPlug( handles[path], name ), value )
+                    edits.append( ( 'setPlug', plugPath, value ) )
+
+        for inputPlug, outputPlug in connections:
+            current = None
+            if isinstance( inputPlug, basestring ):
+                nodePath, plugName = inputPlug.rsplit( '.', 1 )
+                current = inputs.get( ( nodePath, plugName ) )
+            elif isinstance( inputPlug, Plug ):
+                # existing plug, compared by long name as described ones
+                liveInputs = inputPlug.connections( source = False, destination = True )
+                if liveInputs:
+                    current = longName( liveInputs[0] )
+
+            if outputPlug is None:
+                if current is not None:
+                    nodePath, plugName = current.rsplit( '.', 1 )
+                    self.disconnect( plug( inputPlug ), Plug( plugName, Node( nodePath ) ) )
+                    edits.append( ( 'disconnect', inputPlug, current ) )
+            elif current is None or current != longName( outputPlug ):
+                self.connect( plug( inputPlug ), plug( outputPlug ) )
+                edits.append( ( 'connect', inputPlug, outputPlug ) )
 
     def createRef( self, name, path, parent = None ):
 
@@ -404,7 +1907,11 @@ class ModificationContext( object ):
         http://www.guerillarender.com/redmine/issues/230
         '''
 
-        ref, roots = self._mod.createref( name, path, parent._node if parent else None )
+        # a reference is loaded right away, apply previous operations first
+        self.flush()
+        ref, roots = self._mod.createref( name, path, toLua( parent ) if parent else None )
+        _forgetAttrs( parent )
+        _sceneIndex.clear()
         return ( fromLua( ref ), fromLua( roots ) )
 
     def moveNode( self, node, newParentNode ):
@@ -417,10 +1924,22 @@ class ModificationContext( object ):
         @param newParentNode (Node)
         new parent node
         @return (bool) 
-        True on success else False
+        True on success else False (None in batch mode)
         '''
 
-        return self._mod.movenode( node._node, newParentNode._node )
+        if self.batch:
+            return self._record( 'movenode', node, newParentNode )
+
+        _forgetAttrs( node.parent )
+        _forgetAttrs( newParentNode )
+
+        if not _sceneIndex.built:
+            return self._mod.movenode( node._node, newParentNode._node )
+
+        oldPath = node.longName
+        result = self._mod.movenode( node._node, newParentNode._node )
+        _sceneIndex.move( oldPath, node.longName )
+        return result
 
     def deleteNode( self, node ):
 
@@ -434,6 +1953,13 @@ class ModificationContext( object ):
         return issue --> http://www.guerillarender.com/redmine/issues/218
         '''
 
+        if self.batch:
+            return self._record( 'deletenode', node )
+
+        _nodeCache.forget( node )
+        _forgetAttrs( node.parent )
+        if _sceneIndex.built:
+            _sceneIndex.remove( node.longName )
         self._mod.deletenode( node._node )
 
     def renameNode( self, node, newName ):
@@ -450,7 +1976,18 @@ class ModificationContext( object ):
         return issue --> http://www.guerillarender.com/redmine/issues/241
         '''
 
+        if self.batch:
+            return self._record( 'renamenode', node, newName )
+
+        _forgetAttrs( node.parent )
+
+        if not _sceneIndex.built:
+            self._mod.renamenode( node._node, newName )
+            return
+
+        oldPath = node.longName
         self._mod.renamenode( node._node, newName )
+        _sceneIndex.move( oldPath, node.longName )
 
     # ##
     # plug functions
@@ -477,7 +2014,7 @@ class ModificationContext( object ):
         @param flags (int - Plug.flags)
         Plug flag, ex: Plug.NoSerial, 0 (default)
         @return (Plug)
-        created plug instance
+        created plug instance (PendingPlug in batch mode)
         
         @throws (AttributeError)
         raise an exception if plug already exists
@@ -504,6 +2041,12 @@ class ModificationContext( object ):
 
         gtype = Gtypes( dataType ) if isinstance( dataType, Gtypes ) == False else dataType
 
+        if self.batch:
+            # existing plug is checked lua side
+            self._record( 'createplug', luaPlugType, node, name, flags, gtype,
+                    toLua( gtype.value ) if gtype.value is not None else gtype.default )
+            return PendingPlug( node, name )
+
         hasplug = node.hasPlug( name )
 
         if not hasplug:
@@ -516,6 +2059,7 @@ class ModificationContext( object ):
         else:
             raise AttributeError( '%s plug already exists' % name )
 
+        _forgetAttrs( node )
         return Plug( name, node )
 
     def deletePlug( self, plug ):
@@ -527,6 +2071,10 @@ class ModificationContext( object ):
         plug object to delete
         '''
 
+        if self.batch:
+            return self._record( 'deleteplug', plug )
+
+        _forgetAttrs( plug.parent )
         self._mod.deleteplug( plug._plug )
 
     def setPlug( self, plug, value ):
@@ -538,8 +2086,60 @@ class ModificationContext( object ):
         @param value: new plug value
         '''
 
+        if self.batch:
+            return self._record( 'set', plug, value )
+
         self._mod.set( plug._plug, toLua( value ) )
 
+    def setPlugs( self, values ):
+
+        '''
+        Set many plug values in a single lua call
+
+        @param values (dict or list - tuple)
+        plug -> value dict, or (plug, value) pairs
+
+        @code
+        with ModificationContext() as m:
+            m.setPlugs({doc.FirstFrame: 1, doc.LastFrame: 250})
+        @endcode
+        '''
+
+        items = values.items() if hasattr( values, 'items' ) else list( values )
+
+        if self.batch:
+            for plug, value in items:
+                self._record( 'set', plug, value )
+            return
+
+        if items:
+            plugs, values = zip( *items )
+            _luaFunction( 'setplugs' )( self._mod, toLua( plugs ), toLua( values ), len( plugs ) )
+
+    def getPlugs( self, plugs ):
+
+        '''
+        Get many plug values in a single lua call
+
+        @param plugs (list - Plug)
+        plugs to read
+        @return (list)
+        plug values, in plugs order
+        '''
+
+        # recorded values are not applied yet
+        self.flush()
+
+        plugs = list( plugs )
+        if not plugs:
+            return []
+
+        luaValues, nils = _luaFunction( 'getplugs' )( toLua( plugs ), len( plugs ) )
+        values = fromLua( luaValues )
+        for i in nils.split():
+            values[int( i ) - 1] = None
+        return values
+
     def connect( self, inputPlug, outputPlug ):
 
         '''
@@ -551,6 +2151,10 @@ class ModificationContext( object ):
         output plug
         '''
 
+        if self.batch:
+            # plug type is checked lua side
+            return self._record( 'connect', inputPlug, outputPlug )
+
         if not inputPlug.isTyped():
             raise RuntimeError( 'Plug is not typed: use addDependency instead' )
 
@@ -567,6 +2171,9 @@ class ModificationContext( object ):
         output plug to be disconnected
         '''
 
+        if self.batch:
+            return self._record( 'disconnect', inputPlug, outputPlug )
+
         self._mod.disconnect( inputPlug._plug, outputPlug._plug )
 
     def addDependency( self, inputPlug, outputPlug ):
@@ -580,6 +2187,9 @@ class ModificationContext( object ):
         output plug        
         '''
 
+        if self.batch:
+            return self._record( 'adddependency', inputPlug, outputPlug )
+
         self._mod.adddependency( inputPlug._plug, outputPlug._plug )
 
     def removeDependency( self, inputPlug, outputPlug = None ):
@@ -594,11 +2204,105 @@ class ModificationContext( object ):
         output plug. If None, remove all dependencies
         '''
 
+        if self.batch:
+            if outputPlug is None:
+                return self._record( 'removealldependencies', inputPlug )
+            return self._record( 'removedependency', inputPlug, outputPlug )
+
         if outputPlug is None:
             self._mod.removealldependencies( inputPlug._plug )
         else:
             self._mod.removedependency( inputPlug._plug, outputPlug._plug )
 
+    def _applyEdges( self, name, edges, checkTyped = False ):
+
+        '''
+        Apply a modifier function to many (input plug, output plug) pairs
+        in a single lua call
+
+        @param name (str)
+        lua modifier function, ex: connect
+        @param edges (list - tuple)
+        (input plug, output plug) pairs
+        @param checkTyped (bool)
+        if True, check all input plugs are typed before applying anything
+
+        @throws (RuntimeError)
+        raise an exception if checkTyped is True and an input plug is not typed
+        '''
+
+        edges = list( edges )
+
+        if self.batch:
+            for inputPlug, outputPlug in edges:
+                self._record( name, inputPlug, outputPlug )
+            return
+
+        if not edges:
+            return
+
+        inputs, outputs = zip( *edges )
+        untyped = _luaFunction( 'applyedges' )( self._mod, name,
+                toLua( inputs ), toLua( outputs ), len( edges ), checkTyped )
+
+        if untyped:
+            names = [ inputs[int( i ) - 1].name for i in untyped.split() ]
+            raise RuntimeError( 'Plugs are not typed: use addDependencies instead (%s)' % ', '.join( names ) )
+
+    def connectMany( self, edges ):
+
+        '''
+        Connect many plugs in a single lua call
+
+        @param edges (list - tuple)
+        (input plug, output plug) pairs
+
+        @throws (RuntimeError)
+        raise an exception if an input plug is not typed,
+        nothing is connected in that case
+        '''
+
+        self._applyEdges( 'connect', edges, checkTyped = True )
+
+    def disconnectMany( self, edges ):
+
+        '''
+        Disconnect many plugs in a single lua call
+
+        @param edges (list - tuple)
+        (input plug, output plug) pairs
+        '''
+
+        self._applyEdges( 'disconnect', edges )
+
+    def addDependencies( self, edges ):
+
+        '''
+        Add many dependencies in a single lua call
+
+        @param edges (list - tuple)
+        (input plug, output plug) pairs
+        '''
+
+        self._applyEdges( 'adddependency', edges )
+
+    def removeDependencies( self, edges ):
+
+        '''
+        Remove many dependencies in a single lua call
+
+        @param edges (list - tuple)
+        (input plug, output plug) pairs. If output plug is None,
+        remove all dependencies of input plug
+        '''
+
+        edges = list( edges )
+        if self.batch:
+            for inputPlug, outputPlug in edges:
+                self.removeDependency( inputPlug, outputPlug )
+        else:
+            self._applyEdges( 'removedependency', edges )
+
     def touch( self, plug ):
 
         '''
@@ -608,6 +2312,9 @@ class ModificationContext( object ):
         plug to invalidate
         '''
 
+        if self.batch:
+            return self._record( 'touch', plug )
+
         self._mod.touch( plug._plug )
 
     def select( self, nodes, mode = 'add' ):
@@ -628,6 +2335,9 @@ class ModificationContext( object ):
         http://www.guerillarender.com/redmine/issues/222
         '''
 
+        if self.batch:
+            return self._record( 'select', list( nodes ), mode )
+
         # cf todo
         if self._mod.select is None:
             raise RuntimeError( 'Could not access select method, create a modification context first...' )
@@ -641,15 +2351,725 @@ class ModificationContext( object ):
         Retrieve current modification context
 
         @return (ModificationContext)
-        current modification context; a dummy context is returned if required
+        current modification context: innermost context opened with 'with'
+        else a new one; a dummy context is returned if required
         '''
 
+        contexts = _openContexts.contexts
+        if contexts:
+            return contexts[-1]
+
         mc = ModificationContext()
         luaDoc = mc.doc._doc
         mc._mod = luaDoc.getmodifier( luaDoc )
         return mc
 
 
+# apply operations recorded by a batched ModificationContext
+# ops: { { name, args... }, ... }, pending handles are { __pending = index [, plug = name ] }
+# and plugs created on existing nodes { __plugof = node, plug = name }
+# return created nodes, their id and kind (see nodeinfo) by pending index
+_luaSources['applyops'] = '''
+function( mod, doc, ops, nodeinfo )
+    local created, ids, kinds, validTypes = {}, {}, {}, {}
+    local function resolve( a )
+        if type( a ) == 'table' and rawget( a, '__plugof' ) then
+            return a.__plugof[a.plug]
+        end
+        if type( a ) == 'table' and rawget( a, '__pending' ) then
+            local node = created[a.__pending]
+            if a.plug then
+                return node[a.plug]
+            end
+            return node
+        end
+        return a
+    end
+    for i = 1, #ops do
+        local op = ops[i]
+        local name = op[1]
+        if name == 'createnode' then
+            local nodeType, index = op[3], op[5].__pending
+            if not validTypes[nodeType] then
+                if not isclass( nodeType ) then
+                    error( 'not a valid node type: ' .. tostring( nodeType ) )
+                end
+                validTypes[nodeType] = true
+            end
+            local node = mod.createnode( resolve( op[2] ) or doc, nodeType, op[4] )
+            created[index] = node
+            ids[index], kinds[index] = nodeinfo( node )
+        elseif name == 'createplug' then
+            local node, plugName = resolve( op[3] ), op[4]
+            if isclassof( node[plugName], 'Plug' ) then
+                error( plugName .. ' plug already exists' )
+            end
+            mod.createplug( op[2], node, plugName, op[5], op[6], op[7] )
+        elseif name == 'connect' then
+            local input = resolve( op[2] )
+            if input.gettype( input ) == nil then
+                error( 'Plug is not typed: use addDependency instead' )
+            end
+            mod.connect( input, resolve( op[3] ) )
+        elseif name == 'select' then
+            local nodes = {}
+            for j, n in ipairs( op[2] ) do
+                nodes[j] = resolve( n )
+            end
+            mod.select( nodes, op[3] )
+        else
+            -- deletenode, renamenode, movenode, deleteplug, set, disconnect,
+            -- adddependency, removedependency, removealldependencies, touch
+            mod[name]( resolve( op[2] ), resolve( op[3] ) )
+        end
+    end
+    return created, ids, kinds
+end
+'''
+
+# set plugs[i] to values[i], i = 1..n
+_luaSources['setplugs'] = '''
+function( mod, plugs, values, n )
+    local set = mod.set
+    for i = 1, n do
+        set( plugs[i], values[i] )
+    end
+end
+'''
+
+# values of plugs[i], i = 1..n, nil values are stored as false
+# and their indices returned as a string
+_luaSources['getplugs'] = '''
+function( plugs, n )
+    local values, nils = {}, {}
+    for i = 1, n do
+        local p = plugs[i]
+        local v = p.get( p )
+        if v == nil then
+            v = false
+            nils[#nils + 1] = i
+        end
+        values[i] = v
+    end
+    return values, table.concat( nils, ' ' )
+end
+'''
+
+# values of plugs[j], j = 1..n, at each time of frames: the document Time
+# is set for each frame, then restored, outside of any modifier so that
+# plugs are evaluated at the new time (and nothing is undoable)
+# return rows of values by frame, nil values are stored as false and their
+# 'frame index plug index' returned as lines
+_luaSources['sampleplugs'] = '''
+function( doc, plugs, n, frames )
+    local time = doc.Time
+    local current = time.get( time )
+    local rows, nils = {}, {}
+    local ok, err = pcall( function()
+        for i = 1, #frames do
+            time.set( time, frames[i] )
+            local row = {}
+            for j = 1, n do
+                local p = plugs[j]
+                local v = p.get( p )
+                if v == nil then
+                    v = false
+                    nils[#nils + 1] = i .. ' ' .. j
+                end
+                row[j] = v
+            end
+            rows[i] = row
+        end
+    end )
+    time.set( time, current )
+    if not ok then
+        error( err, 0 )
+    end
+    return rows, table.concat( nils, '\\n' )
+end
+'''
+
+# call modifier function name( inputs[i], outputs[i] ), i = 1..n
+# if typed, nothing is done if some inputs are not typed and
+# their indices are returned as a string
+_luaSources['applyedges'] = '''
+function( mod, name, inputs, outputs, n, typed )
+    if typed then
+        local untyped = {}
+        for i = 1, n do
+            local p = inputs[i]
+            if p.gettype( p ) == nil then
+                untyped[#untyped + 1] = i
+            end
+        end
+        if #untyped > 0 then
+            return table.concat( untyped, ' ' )
+        end
+    end
+    local apply = mod[name]
+    for i = 1, n do
+        local output = outputs[i]
+        if output == nil and name == 'removedependency' then
+            mod.removealldependencies( inputs[i] )
+        else
+            apply( inputs[i], output )
+        end
+    end
+    return nil
+end
+'''
+
+# values and inputs of plugs names[i] of nodes[i]:
+# values[i] = { name -> value }, nil values and inputs as
+# 'i\tname' and 'i\tname\tlong name.plug' lines
+_luaSources['plugstate'] = '''
+function( nodes, names )
+    local values, nils, inputs = {}, {}, {}
+    for i, node in ipairs( nodes ) do
+        local nodeValues = {}
+        for _, name in ipairs( names[i] ) do
+            local plug = node[name]
+            if plug ~= nil and isclassof( plug, 'Plug' ) then
+                local value = plug:get()
+                if value == nil then
+                    nils[#nils + 1] = i .. '\\t' .. name
+                else
+                    nodeValues[name] = value
+                end
+                local input = plug:getinput()
+                if input ~= nil then
+                    local inputNode = input:getnode()
+                    inputs[#inputs + 1] = i .. '\\t' .. name .. '\\t' .. inputNode:getpath() .. '.' .. input:getname()
+                end
+            end
+        end
+        values[i] = nodeValues
+    end
+    return values, table.concat( nils, '\\n' ), table.concat( inputs, '\\n' )
+end
+'''
+
+def _sameValue( live, wanted ):
+
+    '''
+    Compare a live plug value (fromLua) to a described one
+    '''
+
+    # Point3 are compared by coordinates
+    if isinstance( live, Point3 ):
+        live = live.value
+    if isinstance( wanted, Point3 ):
+        wanted = wanted.value
+    elif isinstance( wanted, tuple ):
+        wanted = list( wanted )
+    return live == wanted
+
+# unique id of a lua node (see _nodeCache) and its kind:
+# python class Camera, ReferenceBase or Node (see _nodeKindClasses)
+_luaSources['nodeinfo'] = '''
+( function()
+    local ids = setmetatable( {}, { __mode = 'k' } )
+    local kinds = setmetatable( {}, { __mode = 'k' } )
+    local last = 0
+    return function( node )
+        local id = ids[node]
+        if id == nil then
+            last = last + 1
+            id = last
+            ids[node] = id
+            if isclassof( node, 'Camera' ) then
+                kinds[node] = 'Camera'
+            elseif isclassof( node, 'ReferenceBase' ) then
+                kinds[node] = 'ReferenceBase'
+            else
+                kinds[node] = 'Node'
+            end
+        end
+        return id, kinds[node]
+    end
+end )()
+'''
+
+# node at path (see Node), its nodeinfo id and kind, or nil, 0, ''
+_luaSources['findnode'] = '''
+function( path, nodeinfo )
+    local node = _( path )
+    if node == nil then
+        return nil, 0, ''
+    end
+    local id, kind = nodeinfo( node )
+    return node, id, kind
+end
+'''
+
+# nodes at paths[i], i = 1..n (false if missing) and their nodeinfo as
+# a string: 'id kind id kind...' ('0 -' if missing)
+_luaSources['findnodes'] = '''
+function( paths, n, nodeinfo )
+    local nodes, infos = {}, {}
+    for i = 1, n do
+        local node = _( paths[i] )
+        if node ~= nil and isclassof( node, 'Node' ) then
+            local id, kind = nodeinfo( node )
+            nodes[i] = node
+            infos[i] = id .. ' ' .. kind
+        else
+            nodes[i] = false
+            infos[i] = '0 -'
+        end
+    end
+    return nodes, table.concat( infos, ' ' )
+end
+'''
+
+# nodes of a table (array or dict) as an array and their
+# nodeinfo as a string: 'id kind id kind...'
+_luaSources['nodelist'] = '''
+function( t, nodeinfo )
+    local nodes, infos = {}, {}
+    if #t > 0 then
+        for i, node in ipairs( t ) do
+            nodes[i] = node
+        end
+    else
+        for _, node in pairs( t ) do
+            nodes[#nodes + 1] = node
+        end
+    end
+    for i = 1, #nodes do
+        local id, kind = nodeinfo( nodes[i] )
+        infos[i] = id .. ' ' .. kind
+    end
+    return nodes, table.concat( infos, ' ' )
+end
+'''
+
+# plug or child node of node named name:
+# 'Plug', plug, 0, '' or 'Node', child, id, kind (see nodeinfo) or false
+# 'Cached' if it is still cached, the previously resolved plug or node
+_luaSources['resolveattr'] = '''
+function( node, name, nodeinfo, cached )
+    local attr = node[name]
+    if attr ~= nil and isclassof( attr, 'Plug' ) then
+        if rawequal( attr, cached ) then
+            return 'Cached', false, 0, ''
+        end
+        return 'Plug', attr, 0, ''
+    end
+    local children = node.Children
+    if children ~= nil then
+        attr = children[name]
+        if attr ~= nil and isclassof( attr, 'Node' ) then
+            if rawequal( attr, cached ) then
+                return 'Cached', false, 0, ''
+            end
+            local id, kind = nodeinfo( attr )
+            return 'Node', attr, id, kind
+        end
+    end
+    return false, false, 0, ''
+end
+'''
+
+# iterative walk below root (see _walk), returns a step function:
+# step( count, cuts ) -> nodes, 'id kind match ...', paths ('\\n' separated,
+# only if all is true)
+# cuts are indices in the previous step nodes whose descendants are skipped
+_luaSources['walker'] = '''
+function( root, nodeType, maxDepth, dfs, all, nodeinfo )
+    local qnodes, qparents, qdepths = {}, {}, {}
+    local head, tail = 1, 0
+    local cut = {}
+    local last = {}
+
+    local function expand( node, depth )
+        if maxDepth >= 0 and depth >= maxDepth then
+            return
+        end
+        local children = node.Children
+        if children == nil then
+            return
+        end
+        local found = {}
+        for _, child in pairs( children ) do
+            if isclassof( child, 'Node' ) then
+                found[#found + 1] = child
+            end
+        end
+        -- dfs pops the last pushed node first
+        local first, stop, inc = 1, #found, 1
+        if dfs then
+            first, stop, inc = #found, 1, -1
+        end
+        for i = first, stop, inc do
+            tail = tail + 1
+            qnodes[tail], qparents[tail], qdepths[tail] = found[i], node, depth + 1
+        end
+    end
+
+    expand( root, 0 )
+
+    return function( count, cuts )
+        for index in string.gmatch( cuts, '%d+' ) do
+            cut[last[tonumber( index )]] = true
+        end
+        local nodes, infos, paths = {}, {}, {}
+        while #nodes < count do
+            local index
+            if dfs then
+                if tail == 0 then
+                    break
+                end
+                index = tail
+                tail = tail - 1
+            else
+                if head > tail then
+                    break
+                end
+                index = head
+                head = head + 1
+            end
+            local node, parent, depth = qnodes[index], qparents[index], qdepths[index]
+            qnodes[index], qparents[index], qdepths[index] = nil, nil, nil
+
+            if cut[parent] then
+                cut[node] = true
+            else
+                local match = isclassof( node, nodeType )
+                if all or match then
+                    local id, kind = nodeinfo( node )
+                    nodes[#nodes + 1] = node
+                    infos[#infos + 1] = id .. ' ' .. kind .. ' ' .. ( match and 1 or 0 )
+                    if all then
+                        paths[#paths + 1] = node:getpath()
+                    end
+                end
+                expand( node, depth )
+            end
+        end
+        last = nodes
+        return nodes, table.concat( infos, ' ' ), table.concat( paths, '\\n' )
+    end
+end
+'''
+
+# long names and class names of all the document nodes ('\\n' separated)
+_luaSources['scenepaths'] = '''
+function( doc )
+    local paths, classes = {}, {}
+    local stack, n = { doc }, 1
+    while n > 0 do
+        local node = stack[n]
+        stack[n] = nil
+        n = n - 1
+        local children = node.Children
+        if children ~= nil then
+            for _, child in pairs( children ) do
+                if isclassof( child, 'Node' ) then
+                    paths[#paths + 1] = child:getpath()
+                    classes[#classes + 1] = getclassname( child )
+                    n = n + 1
+                    stack[n] = child
+                end
+            end
+        end
+    end
+    return table.concat( paths, '\\n' ), table.concat( classes, '\\n' )
+end
+'''
+
+# set of node keys that are not plugs
+_luaSources['refusedkeys'] = '''
+function()
+    local refused = {}
+    for k, v in pairs( nodesRefusedKey ) do
+        refused[type( k ) == 'string' and k or v] = true
+    end
+    return refused
+end
+'''
+
+# plug names of node (space separated)
+_luaSources['plugnames'] = '''
+function( node, refusedkeys )
+    local refused, names = refusedkeys(), {}
+    for key, attr in pairs( node ) do
+        if type( key ) == 'string' and not refused[key] and isclassof( attr, 'Plug' ) then
+            names[#names + 1] = key
+        end
+    end
+    return table.concat( names, ' ' )
+end
+'''
+
+# long name -> { plug name -> value } for each node of nodes, and
+# nil values as 'long name\\tplug name' lines
+_luaSources['snapshot'] = '''
+function( nodes, refusedkeys )
+    local refused, result, nils = refusedkeys(), {}, {}
+    for _, node in ipairs( nodes ) do
+        local path, values = node:getpath(), {}
+        for key, attr in pairs( node ) do
+            if type( key ) == 'string' and not refused[key] and isclassof( attr, 'Plug' ) then
+                local value = attr:get()
+                if value == nil then
+                    nils[#nils + 1] = path .. '\\t' .. key
+                else
+                    values[key] = value
+                end
+            end
+        end
+        result[path] = values
+    end
+    return result, table.concat( nils, '\\n' )
+end
+'''
+
+# plugs reachable from starts, upstream (inputs and dependencies) or
+# downstream (outputs and back dependencies), breadth first, at most maxDepth
+# edges away (no limit if negative)
+# if node is given, starts are its plugs and other reached nodes are returned
+_luaSources['plugclosure'] = '''
+function( starts, upstream, maxDepth, node, refusedkeys )
+    if node ~= nil then
+        local refused = refusedkeys()
+        starts = {}
+        for key, attr in pairs( node ) do
+            if type( key ) == 'string' and not refused[key] and isclassof( attr, 'Plug' ) then
+                starts[#starts + 1] = attr
+            end
+        end
+    end
+
+    local seen, result, queue, depths = {}, {}, {}, {}
+    for i, plug in ipairs( starts ) do
+        seen[plug] = true
+        queue[i], depths[i] = plug, 0
+    end
+
+    local function visit( plug, depth )
+        if plug ~= nil and not seen[plug] then
+            seen[plug] = true
+            result[#result + 1] = plug
+            local n = #queue + 1
+            queue[n], depths[n] = plug, depth
+        end
+    end
+
+    local function visitall( plugs, depth )
+        if plugs ~= nil then
+            for _, plug in pairs( plugs ) do
+                visit( plug, depth )
+            end
+        end
+    end
+
+    local head = 1
+    while head <= #queue do
+        local plug, depth = queue[head], depths[head]
+        head = head + 1
+        if maxDepth < 0 or depth < maxDepth then
+            if upstream then
+                visit( plug:getinput(), depth + 1 )
+                visitall( plug:getdependencies(), depth + 1 )
+            else
+                visitall( plug:getoutputs(), depth + 1 )
+                visitall( plug:getbackdependencies(), depth + 1 )
+            end
+        end
+    end
+
+    if node == nil then
+        return result
+    end
+
+    local nodes, found = {}, { [node] = true }
+    for _, plug in ipairs( result ) do
+        local other = plug:getnode()
+        if not found[other] and isclassof( other, 'Node' ) then
+            found[other] = true
+            nodes[#nodes + 1] = other
+        end
+    end
+    return nodes
+end
+'''
+
+# children of node deriving from nodeType
+_luaSources['children'] = '''
+function( node, nodeType )
+    local result, children = {}, node.Children
+    if children ~= nil then
+        for _, child in pairs( children ) do
+            if isclassof( child, nodeType ) then
+                result[#result + 1] = child
+            end
+        end
+    end
+    return result
+end
+'''
+
+
+class PendingNode( object ):
+
+    '''
+    Node created in a batched ModificationContext
+
+    Before the context is flushed, attributes are PendingPlug handles
+    usable as arguments of the context methods. Afterwards, the handle
+    behaves like the created Node
+
+    Examples:
+
+    @code
+    with ModificationContext(batch=True) as m:
+        n = m.createNode('foo')
+        m.setPlug(n.Visible, False)
+    print n.node.name
+    @endcode
+    '''
+
+    def __init__( self, index, name ):
+
+        # index in batch, see applyops lua helper
+        self._index = index
+        self._name = name
+        # lua tables of created nodes, their id and kind, set on flush
+        self._created = None
+        self._resolved = None
+
+    @property
+    def isResolved( self ):
+
+        '''
+        True if the batch was flushed
+        '''
+
+        return self._created is not None
+
+    @property
+    def node( self ):
+
+        '''
+        Created node
+
+        @return (Node)
+
+        @throws (RuntimeError)
+        raise an exception if the batch was not flushed yet
+        '''
+
+        if self._resolved is None:
+            if self._created is None:
+                raise RuntimeError( 'node %s is not created yet, flush the modification context first' % self._name )
+            index = self._index
+            created, ids, kinds = self._created
+            self._resolved = Node._wrap( created[index], kinds[index], ids[index] )
+        return self._resolved
+
+    @property
+    def _node( self ):
+
+        # lua node, as in Node
+        return self.node._node
+
+    def __getattr__( self, value ):
+
+        if value.startswith( '_' ):
+            raise AttributeError( value )
+
+        if self._created is None:
+            return PendingPlug( self, value )
+        return getattr( self.node, value )
+
+    def __toLua__( self ):
+
+        if self._created is None:
+            return toLua( { '__pending': self._index } )
+        return self._node
+
+
+class PendingPlug( object ):
+
+    '''
+    Plug of a node (or PendingNode) created in a batched ModificationContext
+    '''
+
+    def __init__( self, node, name ):
+
+        self._pendingNode = node
+        self._name = name
+
+    @property
+    def name( self ):
+        return self._name
+
+    @property
+    def plug( self ):
+
+        '''
+        Resolved plug
+
+        @return (Plug)
+
+        @throws (RuntimeError)
+        raise an exception if the batch was not flushed yet
+        '''
+
+        node = self._pendingNode
+        if isinstance( node, PendingNode ):
+            node = node.node
+        return Plug( self._name, node )
+
+    @property
+    def _plug( self ):
+
+        # lua plug, as in Plug
+        return self.plug._plug
+
+    def __toLua__( self ):
+
+        node = self._pendingNode
+        if isinstance( node, PendingNode ):
+            if not node.isResolved:
+                return toLua( { '__pending': node._index, 'plug': self._name } )
+        elif not node.hasPlug( self._name ):
+            # plug of an existing node created by the batch, see applyops
+            return toLua( { '__plugof': node, 'plug': self._name } )
+        return self._plug
+
+
+# world transform matrices of nodes, packed as '%.17g' numbers (16 per
+# node, or only the translation 13 to 15 if positionsOnly) and an empty
+# string; false and the path of the first node that is not a SceneGraphNode
+# getworldtransform returns a 4x4 matrix indexed like point3 (see
+# point3values), row by row with the translation in the 4th row, the
+# layout is checked in testDocument against TransformEuler translations
+# and Camera.setWorldPositionTargetUp
+_luaSources['worldtransforms'] = '''
+function( nodes, positionsOnly )
+    local format, out, k = string.format, {}, 0
+    local first, last = 1, 16
+    if positionsOnly then
+        first, last = 13, 15
+    end
+    for i = 1, #nodes do
+        local node = nodes[i]
+        if not isclassof( node, 'SceneGraphNode' ) then
+            return false, node:getpath()
+        end
+        local m = node:getworldtransform()
+        for j = first, last do
+            k = k + 1
+            out[k] = format( '%.17g', m[j] )
+        end
+    end
+    return table.concat( out, ' ' ), ''
+end
+'''
+
+
 class Document( object ):
 
     '''
@@ -693,8 +3113,7 @@ class Document( object ):
             return Plug( value, self )
         elif value in Document.VALID_CHILDREN:
             if value == 'Preferences':
-                luaPrefNode = self._luaGlobals.getpreferences()
-                return Node( luaPrefNode.getname( luaPrefNode ) )
+                return Node._wrap( self._luaGlobals.getpreferences() )
         else:
             raise AttributeError( 'unknown plug %s (valid plugs: %s)' % ( value, Document.VALID_CHILDREN ) )
 
@@ -742,11 +3161,218 @@ class Document( object ):
         iterator of Nodes
         '''
 
-        # TODO: recursive
-        for i in self._doc.Children:
-            obj = getattr( self._doc.Children, str( i ) )
-            if self._luaGlobals.isclassof( obj, type ):
-                yield Node( str( obj.getpath( obj )[0] ) )
+        return iter( _wrapNodes( _luaFunction( 'children' )( self._doc, type ) ) )
+
+    def walk( self, type = 'Node', maxDepth = None, prune = None, order = 'bfs' ):
+
+        '''
+        Iterator over all descendant nodes
+
+        Nodes are collected lua side and transferred by chunks
+        of WALK_CHUNK_SIZE nodes
+
+        @param type (str)
+        only return node with given type, ex. SceneGraphNode, Texture...
+        @param maxDepth (int)
+        maximum depth, 1 for children only (default: no limit)
+        @param prune (callable)
+        called with the long name of each visited node (any type),
+        descendants of a node are skipped when it returns True
+        @param order (str)
+        'bfs' (breadth first, default) or 'dfs' (depth first, pre-order)
+        @return (iterator)
+        iterator of Nodes
+
+        @throws (ValueError)
+        raise an exception if order is not valid, when walk is called
+
+        @code
+        >>> meshes = list( Document().walk( 'Mesh', prune=lambda path: path.endswith( '|proxy' ) ) )
+        @endcode
+        '''
+
+        return _walk( self._doc, type, maxDepth, prune, order )
+
+    def snapshot( self, nodes ):
+
+        '''
+        Values of all plugs of nodes, read in a single lua call
+
+        @param nodes (list - Node)
+        nodes to read
+        @return (dict)
+        node long name -> { plug name -> value }
+
+        @code
+        >>> values = Document().snapshot( Document().find( 'chars|*', type='Shader' ) )
+        @endcode
+        '''
+
+        result, nils = _luaFunction( 'snapshot' )( toLua( list( nodes ) ),
+                _luaFunction( 'refusedkeys' ) )
+        result = fromLua( result )
+
+        for line in nils.splitlines():
+            path, name = line.split( '\t' )
+            result[path][name] = None
+
+        return result
+
+    def worldMatrices( self, nodes ):
+
+        '''
+        World transform matrices of nodes, read in a single lua call
+
+        @param nodes (list - Node)
+        scene graph nodes (SceneGraphNode, Camera...)
+        @return (numpy array or array.array)
+        N x 16 numpy array, or flat array.array( 'd' ) of 16 * N numbers
+        if numpy is missing; translation is at 12, 13, 14 of each matrix
+        @throws TypeError
+        if a node is not a SceneGraphNode
+
+        @code
+        >>> matrices = Document().worldMatrices( Document().find( 'set|*', type='SceneGraphNode' ) )
+        @endcode
+        '''
+
+        values = self._worldTransforms( nodes, False )
+        if numpy is not None:
+            return numpy.array( values, dtype = numpy.float64 ).reshape( -1, 16 )
+        return array.array( 'd', values )
+
+    def worldPositions( self, nodes ):
+
+        '''
+        World positions of nodes, read in a single lua call
+
+        @param nodes (list - Node)
+        scene graph nodes (SceneGraphNode, Camera...)
+        @return (Point3Array)
+        @throws TypeError
+        if a node is not a SceneGraphNode
+
+        @code
+        >>> positions = Document().worldPositions( Document().find( 'set|*', type='SceneGraphNode' ) )
+        >>> bboxMin, bboxMax = positions.boundingBox()
+        @endcode
+        '''
+
+        return Point3Array._fromFlat( self._worldTransforms( nodes, True ) )
+
+    def sample( self, plugs, first, last, step = 1 ):
+
+        '''
+        Values of plugs at each frame of a range, evaluated in a single
+        lua call
+
+        Time is set once per frame, then restored to its current value.
+        Time changes are not undoable, no undo entry is added
+
+        @param plugs (list - Plug)
+        plugs to evaluate
+        @param first (float)
+        first frame
+        @param last (float)
+        last frame, included
+        @param step (float)
+        frame step
+        @return (numpy array or list)
+        frames x plugs values: a numpy array if numpy is available and
+        values are numbers, else a list of rows
+        @throws ValueError
+        if step is not positive
+
+        @code
+        >>> doc = Document()
+        >>> curves = doc.sample( [ cam.Transform, cam.Fov ], doc.FirstFrame.get(), doc.LastFrame.get() )
+        @endcode
+        '''
+
+        if step <= 0:
+            raise ValueError( 'step must be positive: %r' % step )
+
+        # small epsilon so that float steps do not miss the last frame
+        count = int( math.floor( ( last - first ) / float( step ) + 1e-9 ) ) + 1
+        frames = [ first + i * step for i in xrange( max( count, 0 ) ) ]
+        return _samplePlugs( plugs, frames )
+
+    def _worldTransforms( self, nodes, positionsOnly ):
+
+        # flat list of floats, see worldtransforms lua helper
+        packed, path = _luaFunction( 'worldtransforms' )( toLua( list( nodes ) ),
+                positionsOnly )
+        if packed is False:
+            raise TypeError( '%s is not a SceneGraphNode' % path )
+        return [ float( v ) for v in packed.split() ]
+
+    def plugGraph( self, root = None ):
+
+        '''
+        Export plugs, connections and dependencies as integer arrays
+        (single lua call)
+
+        @param root (Node)
+        only export plugs of root and its descendants, plus the plugs
+        they are connected to (default: whole document)
+        @return (PlugGraph)
+
+        @code
+        >>> graph = Document().plugGraph()
+        >>> loops = graph.cycles()
+        @endcode
+        '''
+
+        names, connections, dependencies = _luaFunction( 'pluggraph' )(
+                self._doc if root is None else root._node, _luaFunction( 'refusedkeys' ) )
+
+        return PlugGraph( names.split( '\n' ) if names else [],
+                array.array( 'l', map( int, connections.split() ) ),
+                array.array( 'l', map( int, dependencies.split() ) ) )
+
+    def find( self, pattern, type = None, regex = False, refresh = False ):
+
+        '''
+        Find nodes by long name
+
+        Uses an index of all the document nodes, built on first call and
+        kept up to date by ModificationContext edits. Matching paths are
+        resolved in a single lua call, the index is rebuilt if one of them
+        does not resolve anymore
+
+        @param pattern (str)
+        glob pattern matched against long names (ex: 'chars|*_geo'),
+        or regular expression if regex is True (re.match)
+        @param type (str)
+        only return nodes deriving from type, ex. SceneGraphNode (default: any)
+        @param regex (bool)
+        pattern is a regular expression
+        @param refresh (bool)
+        rebuild the index first
+        @return (list - Node)
+        matching nodes, sorted by long name
+
+        @note
+        nodes deleted, renamed or moved outside of a ModificationContext
+        (ex. undo, redo, lua edits) are detected by the query, nodes
+        created that way are only found once the index is rebuilt: use
+        refresh=True after such edits
+
+        @code
+        >>> geos = Document().find( 'chars|*_geo', type='SceneGraphNode' )
+        @endcode
+        '''
+
+        if refresh:
+            _sceneIndex.clear()
+
+        nodes = _nodesAtPaths( _sceneIndex.find( pattern, type, regex ) )
+        if None in nodes:
+            # index out of date: rebuild it once
+            _sceneIndex.clear()
+            nodes = _nodesAtPaths( _sceneIndex.find( pattern, type, regex ) )
+
+        return [ node for node in nodes if node is not None ]
 
     @staticmethod
     def new( warn = True, nodefault = False ):
@@ -762,6 +3388,7 @@ class Document( object ):
         # FIXME: use lua globals in self?
         luaGlobals = lua.globals()
         luaGlobals.newdocument( warn, nodefault )
+        _resetSession()
 
     @property
     def filename( self ):
@@ -810,7 +3437,9 @@ class Document( object ):
         True if the file was loaded
         '''
 
-        return self._luaGlobals.loaddocument( filename, warn )
+        loaded = self._luaGlobals.loaddocument( filename, warn )
+        _resetSession()
+        return loaded
 
     def loadFile( self, filename ):
 
@@ -830,12 +3459,8 @@ class Document( object ):
         '''
         result = self._doc.loadfile( self._doc, filename )
         # FIXME: check result
-        resultNodes = []
-        for r in result:
-            luaNode = result[r]
-            resultNodes.append( Node( str( luaNode.getname( luaNode ) ) ) )
-
-        return resultNodes
+        _sceneIndex.clear()
+        return _wrapNodes( result )
 
 
 class Node( object ):
@@ -855,58 +3480,52 @@ class Node( object ):
     @endcode    
     '''
 
+    # wrappers are created by hundred thousands, no __dict__
+    __slots__ = ( '_id', '_node', '_attrCache', '__weakref__' )
+
+    _luaGlobals = _luaGlobals
+
     def __new__( cls, *args, **kwargs ):
 
         '''
         Create class according to lua node type 
+
+        The same lua node always gives the same instance (see _nodeCache),
+        the path is resolved on each call
         '''
 
-        lg = lua.globals()
         if args:
             name = args[0]
-            ln = lg._( name )
-
-            # XXX improve this
-            if lg.isclassof( ln, 'Camera' ):
-                classType = Camera
-            elif lg.isclassof( ln, 'ReferenceBase' ):
-
-                # Guerilla sdk fix -->
-                # Reference hierarchy in Guerilla
-                # * Node
-                # ** ReferenceBase
-                # *** DocRef
-                # **** Reference
-                # ***** HostReference
-                # **** ArchReference
-
-                classType = Reference
-            else:
-                classType = Node
         else:
             raise RuntimeError( 'Please provide a name' )
 
-        self = super( Node, cls ).__new__( classType )
-        return self
+        ln, nodeId, kind = _luaFunction( 'findnode' )( name, _luaFunction( 'nodeinfo' ) )
+        if ln is None:
+            raise ValueError( 'node %s does not exist' % name )
+
+        # Guerilla sdk fix -->
+        # Reference hierarchy in Guerilla
+        # * Node
+        # ** ReferenceBase
+        # *** DocRef
+        # **** Reference
+        # ***** HostReference
+        # **** ArchReference
+        # --> see nodeinfo lua helper
+
+        return Node._wrap( ln, kind, nodeId )
 
     def __init__( self, name, luaGlobals = None ):
 
         '''
         Create an instance of Node
         Raise a ValueError if Node does not exist
-        '''
-
-        self._name = name
-
-        if luaGlobals:
-            self._luaGlobals = luaGlobals
-        else:
-            self._luaGlobals = lua.globals()
 
-        self._node = self._luaGlobals._( name )
+        @note
+        node is resolved in __new__
+        '''
 
-        if self._node is None:
-            raise ValueError( 'node %s does not exist' % name )
+        pass
 
     def __str__( self ):
 
@@ -926,7 +3545,37 @@ class Node( object ):
 
     @classmethod
     def __fromLua__( cls, lnode ):
-        return cls( str( lnode.getpath( lnode )[0] ) )
+        return cls._wrap( lnode )
+
+    @classmethod
+    def _wrap( cls, luaNode, kind = None, nodeId = None ):
+
+        '''
+        Get the Node of a lua node, without path lookup
+
+        @param luaNode (lua node)
+        existing lua node
+        @param kind (str)
+        node kind (see nodeinfo lua helper), retrieved with nodeId if None
+        @param nodeId (int)
+        node id (see nodeinfo lua helper), retrieved if None
+        @return (Node)
+        Node, Camera or Reference instance, the same for a given lua node
+        '''
+
+        if nodeId is None:
+            nodeId, kind = _luaFunction( 'nodeinfo' )( luaNode )
+
+        self = _nodeCache.byId( nodeId )
+        if self is None:
+            self = object.__new__( _nodeKindClasses[kind] )
+            self._id = nodeId
+            self._node = luaNode
+            # resolved plugs and children (see __getattr__)
+            self._attrCache = {}
+            _nodeCache.addId( nodeId, self )
+
+        return self
 
     @property
     def name( self ):
@@ -979,7 +3628,7 @@ class Node( object ):
         if self._luaGlobals.isclassof( luaNode, 'Document' ):
             return Document()
         else:
-            return Node( luaNode.getpath( luaNode )[0] )
+            return Node._wrap( luaNode )
 
     def hasAttr( self, name, type ):
 
@@ -1041,32 +3690,46 @@ class Node( object ):
         iterator of Plug objects
         '''
 
-        refusedKeys = list( self._luaGlobals.nodesRefusedKey )
-        for i in self._node:
-            if isinstance( i, str ):
-                attr = getattr( self._node, i )
-                if i not in refusedKeys and self._luaGlobals.isclassof( attr, 'Plug' ):
-                    yield Plug( i, self )
+        names = _luaFunction( 'plugnames' )( self._node, _luaFunction( 'refusedkeys' ) )
+        for name in names.split():
+            yield Plug( name, self )
 
-    # def children(self, type='Node', recursive=False):
-        # '''
-        # iterator over all plugs in Node
+    def upstream( self, depth = None ):
 
-        # @param type: only return node with given type, ex. SceneGraphNode, Texture...
-        # @param recursive: recursive lookup
-        # @return list of Node objects
-        # '''
+        '''
+        All nodes feeding this node plugs, see Plug.upstream
+
+        @param depth (int)
+        maximum number of connections / dependencies to follow (default: no limit)
+        @return (list - Node)
+        reached nodes, closest first
+        '''
+
+        return _nodeClosure( self, True, depth )
+
+    def downstream( self, depth = None ):
+
+        '''
+        All nodes fed by this node plugs, see Plug.downstream
+
+        @param depth (int)
+        maximum number of connections / dependencies to follow (default: no limit)
+        @return (list - Node)
+        reached nodes, closest first
+        '''
+
+        return _nodeClosure( self, False, depth )
+
+    def snapshot( self ):
 
-        # nodes = [self._node.Children]
-        # while nodes:
-            # n = nodes.pop()
-            # if n:
-                # for i in n:
-                    # obj = getattr(self._node.Children, str(i))
-                    # if self._luaGlobals.isclassof(obj, type):
-                        # yield Node('%s|%s' % (self.name, str(i)))
-                    # if recursive and self._luaGlobals.isclassof(obj, 'Node'):
-                        # nodes.append(obj)
+        '''
+        Values of all plugs, read in a single lua call
+
+        @return (dict)
+        plug name -> value
+        '''
+
+        return Document().snapshot( [ self ] ).popitem()[1]
 
     def children( self, type = 'Node' ):
         '''
@@ -1078,28 +3741,68 @@ class Node( object ):
         iterator of Node objects
         '''
 
-        # XXX remove?
-        if self._node.Children is None:
-            raise StopIteration
+        return iter( _wrapNodes( _luaFunction( 'children' )( self._node, type ) ) )
+
+    def walk( self, type = 'Node', maxDepth = None, prune = None, order = 'bfs' ):
+
+        '''
+        Iterator over all descendant nodes
+
+        Nodes are collected lua side and transferred by chunks
+        of WALK_CHUNK_SIZE nodes
+
+        @param type (str)
+        only return node with given type, ex. SceneGraphNode, Texture...
+        @param maxDepth (int)
+        maximum depth, 1 for children only (default: no limit)
+        @param prune (callable)
+        called with the long name of each visited node (any type),
+        descendants of a node are skipped when it returns True
+        @param order (str)
+        'bfs' (breadth first, default) or 'dfs' (depth first, pre-order)
+        @return (iterator)
+        iterator of Nodes
+
+        @throws (ValueError)
+        raise an exception if order is not valid, when walk is called
+
+        @code
+        >>> meshes = list( Document().walk( 'Mesh', prune=lambda path: path.endswith( '|proxy' ) ) )
+        @endcode
+        '''
 
-        for i in self._node.Children:
-            obj = getattr( self._node.Children, str( i ) )
-            if self._luaGlobals.isclassof( obj, type ):
-                yield Node( str( obj.getpath( obj )[0] ) )
+        return _walk( self._node, type, maxDepth, prune, order )
 
     def __getattr__( self, value ):
 
         '''
         Get children or plug
+
+        Resolved plugs and children are cached on the node. A cached
+        wrapper is checked against the lua node on each access, so edits
+        made outside of a ModificationContext (undo, redo, lua) are seen
         '''
 
-        if self.hasPlug( value ):
-            # self.hasPlug(value)
-            return Plug( value, self )
-        elif self.hasChild( value ):
-            return Node( '%s|%s' % ( self.longName, str( value ) ) )
+        # private attributes are never plugs nor children
+        if value.startswith( '_' ):
+            raise AttributeError( value )
+
+        attr = self._attrCache.get( value )
+        kind, luaAttr, nodeId, nodeKind = _luaFunction( 'resolveattr' )( self._node, value,
+                _luaFunction( 'nodeinfo' ), None if attr is None else toLua( attr ) )
+        if kind == 'Cached':
+            return attr
+
+        if kind == 'Plug':
+            attr = Plug.fromHandle( luaAttr, self )
+        elif kind == 'Node':
+            attr = Node._wrap( luaAttr, nodeKind, nodeId )
         else:
+            self._attrCache.pop( value, None )
             raise AttributeError( "unknown node or plug '%s'" % value )
+        self._attrCache[value] = attr
+
+        return attr
 
     def createPlug( self, name, plugType = 'user', dataType = 'string' ):
 
@@ -1107,6 +3810,10 @@ class Node( object ):
         Create a Plug on node
         Use current modification context if available
         see. createPlug function in ModificationContext class
+
+        @note
+        inside a batched ModificationContext the plug is created on flush
+        and a PendingPlug is returned
         '''
 
         mc = ModificationContext.get()
@@ -1148,6 +3855,10 @@ class Node( object ):
         Create a node
         Use current modification context if available
 
+        @note
+        inside a batched ModificationContext the node is created on flush
+        and a PendingNode is returned
+
         Examples:
  
         >>> n = Node.createNode('foo'); n.name # doctest: +ELLIPSIS 
@@ -1192,13 +3903,8 @@ class Node( object ):
         '''
 
         result = self._node.loadfile( self._node, filename )
-        resultNodes = []
-        for r in result:
-            luaNode = result[r]
-            luaNodeLongName = str( luaNode.getpath( luaNode )[0] )
-            resultNodes.append( Node( luaNodeLongName ) )
-
-        return resultNodes
+        _sceneIndex.clear()
+        return _wrapNodes( result )
 
 
 class Camera( Node ):
@@ -1207,6 +3913,8 @@ class Camera( Node ):
     Camera class
     '''
 
+    __slots__ = ()
+
     # FIXME: should be TargetPrimitive?
 
     def setWorldPositionTargetUp( self, position, target, up ):
@@ -1218,7 +3926,8 @@ class Camera( Node ):
         @param target (Point3)
         @param up (Point3)
         '''
-        return self._node.setworldpositiontargetup( position._lp, target._lp, up._lp )
+        return self._node.setworldpositiontargetup( self._node,
+                toLua( position ), toLua( target ), toLua( up ) )
 
     @property
     def worldDirection( self ):
@@ -1228,7 +3937,7 @@ class Camera( Node ):
         '''
 
         lp = self._node.getworlddirection( self._node )
-        return Point3.fromLua( lp )
+        return Point3.__fromLua__( lp )
 
     @property
     def worldUp( self ):
@@ -1237,7 +3946,7 @@ class Camera( Node ):
         @return (Point3)
         '''
         lp = self._node.getworldup( self._node )
-        return Point3.fromLua( lp )
+        return Point3.__fromLua__( lp )
 
     def lookThru( self ):
 
@@ -1260,6 +3969,8 @@ class Camera( Node ):
 
 class Reference( Node ):
 
+    __slots__ = ()
+
     def reloadRef( self, newPath = None ):
 
         # to run this test - run testmod with extraglobs
@@ -1334,24 +4045,45 @@ class TransformModes( object ):
     __metaclass__ = TransformModesMeta
 
 
+# coordinates of a lua point3
+_luaSources['point3values'] = '''
+function( p )
+    return p[1], p[2], p[3]
+end
+'''
+
 class Point3( object ):
 
     '''
     3 dimension point class
+
+    Coordinates are python floats, computations are done in python;
+    a lua point3 is only created when needed (toLua)
+
+    @note
+    * and / are component-wise between two Point3 and scale the
+    coordinates with a number, use dot for the dot product
     '''
 
+    __slots__ = ( '_x', '_y', '_z', '__weakref__' )
+
+    _luaGlobals = _luaGlobals
+
     def __init__( self, x, y, z ):
 
-        self._luaGlobals = lua.globals()
-        self._lp = self._luaGlobals.point3.create( x, y, z )
+        self._x = float( x )
+        self._y = float( y )
+        self._z = float( z )
 
     def __toLua__( self ):
         '''
         Python -> lua object
 
         @return (lua point3)
+        a new point3: lua may modify it
         '''
-        return self._lp
+
+        return self._luaGlobals.point3.create( self._x, self._y, self._z )
 
     @classmethod
     def __fromLua__( cls, lp ):
@@ -1360,26 +4092,52 @@ class Point3( object ):
 
         @return (Point3)
         '''
-        return cls( lp[1], lp[2], lp[3] )
 
-    def __neg__( self ):
+        return cls( *_luaFunction( 'point3values' )( lp ) )
 
-        return Point3.fromLua( -self._lp )
+    def __neg__( self ):
+        return Point3( -self._x, -self._y, -self._z )
 
     def __add__( self, other ):
-        return Point3.fromLua( self._lp + other._lp )
+        if isinstance( other, Point3Array ):
+            return NotImplemented
+        return Point3( self._x + other._x, self._y + other._y, self._z + other._z )
 
     def __sub__( self, other ):
-        return Point3.fromLua( self._lp - other._lp )
+        if isinstance( other, Point3Array ):
+            return NotImplemented
+        return Point3( self._x - other._x, self._y - other._y, self._z - other._z )
 
     def __mul__( self, other ):
-        return Point3.fromLua( self._lp * other._lp )
+
+        # component-wise, or scaled by a number
+        if isinstance( other, Point3Array ):
+            return NotImplemented
+        if isinstance( other, Point3 ):
+            return Point3( self._x * other._x, self._y * other._y, self._z * other._z )
+        return Point3( self._x * other, self._y * other, self._z * other )
+
+    __rmul__ = __mul__
 
     def __div__( self, other ):
-        return Point3.fromLua( self._lp / other._lp )
+
+        # component-wise, or scaled by a number
+        if isinstance( other, Point3Array ):
+            return NotImplemented
+        if isinstance( other, Point3 ):
+            return Point3( self._x / other._x, self._y / other._y, self._z / other._z )
+        return Point3( self._x / other, self._y / other, self._z / other )
+
+    __truediv__ = __div__
 
     def __xor__( self, other ):
-        return Point3.fromLua( self._lp ^ other._lp )
+
+        # cross product
+        if isinstance( other, Point3Array ):
+            return NotImplemented
+        return Point3( self._y * other._z - self._z * other._y,
+                self._z * other._x - self._x * other._z,
+                self._x * other._y - self._y * other._x )
 
     @property
     def x( self ):
@@ -1387,21 +4145,21 @@ class Point3( object ):
         Point3 first element
         '''
 
-        return self._lp[1]
+        return self._x
 
     @property
     def y( self ):
         '''
         Point3 second element
         '''
-        return self._lp[2]
+        return self._y
 
     @property
     def z( self ):
         '''
         Point3 third element
         '''
-        return self._lp[3]
+        return self._z
 
     @property
     def value( self ):
@@ -1412,7 +4170,7 @@ class Point3( object ):
         @return (list)
         '''
 
-        return [self._lp[1], self._lp[2], self._lp[3]]
+        return [ self._x, self._y, self._z ]
 
     @property
     def length( self ):
@@ -1422,7 +4180,7 @@ class Point3( object ):
         @return (float)
         '''
 
-        return self._lp.getlength()
+        return math.sqrt( self.squareLength )
 
     @property
     def squareLength( self ):
@@ -1431,7 +4189,7 @@ class Point3( object ):
 
         @return (float)
         '''
-        return self._lp.getsqlength()
+        return self._x * self._x + self._y * self._y + self._z * self._z
 
     @property
     def isReal( self ):
@@ -1441,59 +4199,435 @@ class Point3( object ):
         @return (bool)
         '''
 
-        return self._lp.isreal()
+        # nan and inf give nan
+        return all( v - v == 0.0 for v in ( self._x, self._y, self._z ) )
+
+    def distance( self, other ):
+        '''
+        Returns the distance between self and other
+
+        @return (float)
+        '''
+        return ( self - other ).length
+
+    def dot( self, other ):
+        '''
+        Returns the dot product between self and other
+
+        @return (float)
+        '''
+        return self._x * other._x + self._y * other._y + self._z * other._z
+
+    def max( self, other ):
+
+        '''
+        Returns the max of each components
+
+        @return (Point3)
+        (max(self.X, other.X), max(self.Y, other.Y), max(self.Z, other.Z)) 
+        '''
+
+        if isinstance( other, Point3 ):
+            return Point3( max( self._x, other._x ), max( self._y, other._y ), max( self._z, other._z ) )
+        else:
+            return Point3( max( self._x, other ), max( self._y, other ), max( self._z, other ) )
+
+    def min( self, other ):
+
+        '''
+        Returns the min of each components
+
+        @return (Point3)
+        (min(self.X, other.X), min(self.Y, other.Y), min(self.Z, other.Z))
+        '''
+
+        if isinstance( other, Point3 ):
+            return Point3( min( self._x, other._x ), min( self._y, other._y ), min( self._z, other._z ) )
+        else:
+            return Point3( min( self._x, other ), min( self._y, other ), min( self._z, other ) )
+
+    def normalized( self ):
+        '''
+        Returns the normalized vector
+
+        @return (Point3)
+        '''
+
+        length = self.length
+        if length == 0.0:
+            return Point3( 0.0, 0.0, 0.0 )
+        return Point3( self._x / length, self._y / length, self._z / length )
+
+
+def _xyz( point ):
+
+    # Point3 or ( x, y, z ) sequence -> tuple of floats
+    if isinstance( point, Point3 ):
+        return ( point._x, point._y, point._z )
+    x, y, z = point
+    return ( float( x ), float( y ), float( z ) )
+
+class Point3Array( object ):
+
+    '''
+    Array of 3 dimension points
+
+    The points are stored in one contiguous float64 buffer: a numpy
+    (N, 3) array when numpy is available, else a flat array.array( 'd' )
+    of 3 * N values. Operations are done on the whole array at once,
+    and conversion from/to a lua table of point3 is one lua call.
+
+    @code
+    points = Point3Array( [ ( 0, 0, 0 ), Point3( 1, 2, 3 ) ] )
+    bboxMin, bboxMax = ( points * 2 ).boundingBox()
+    lpoints = toLua( points )
+    @endcode
+    '''
+
+    __slots__ = ( '_data', '__weakref__' )
+
+    def __init__( self, points = () ):
+
+        '''
+        @param points (iterable)
+        Point3 or ( x, y, z ) sequences, or a numpy (N, 3) array
+        '''
+
+        if numpy is not None:
+            if isinstance( points, numpy.ndarray ):
+                data = numpy.array( points, dtype = numpy.float64 ).reshape( -1, 3 )
+            else:
+                data = numpy.array( [ _xyz( p ) for p in points ],
+                    dtype = numpy.float64 ).reshape( -1, 3 )
+        else:
+            data = array.array( 'd' )
+            for p in points:
+                data.extend( _xyz( p ) )
+        self._data = data
+
+    @classmethod
+    def _wrap( cls, data ):
+
+        # new array using data as buffer, no copy
+        self = cls.__new__( cls )
+        self._data = data
+        return self
+
+    @classmethod
+    def _fromFlat( cls, values ):
+
+        # flat sequence of 3 * N floats -> Point3Array
+        if numpy is not None:
+            return cls._wrap( numpy.array( values, dtype = numpy.float64 ).reshape( -1, 3 ) )
+        return cls._wrap( array.array( 'd', values ) )
+
+    def __toLua__( self ):
+        '''
+        Python -> lua object
+
+        @return (lua table)
+        table of point3
+        '''
+
+        # inf, -inf and nan are decoded by unpacknumbers
+        packed = ' '.join( [ repr( v ) for v in self.flat ] )
+        return _luaFunction( 'unpacknumbers' )( packed, 3, True )
+
+    @classmethod
+    def fromLua( cls, luaTable ):
+
+        '''
+        Lua -> python object
+
+        @param luaTable (lua table)
+        table of point3 or of { x, y, z } tables
+        @return (Point3Array)
+        @throws ValueError
+        if the table is not a table of points
+        '''
+
+        packed = _luaFunction( 'packnumbers' )( luaTable )
+        if packed is None:
+            # empty tables are not packed
+            if _luaGlobals.next( luaTable ) is None:
+                return cls()
+            raise ValueError( 'not a lua table of points' )
+
+        packed, width = packed[0], packed[1]
+        if width != 3:
+            raise ValueError( 'not a lua table of points' )
+        return cls._fromFlat( [ float( v ) for v in packed.split() ] )
+
+    @property
+    def data( self ):
+        '''
+        Points buffer, numpy (N, 3) array or flat array.array( 'd' )
+        '''
+
+        return self._data
+
+    @property
+    def flat( self ):
+        '''
+        Coordinates as a flat list of 3 * N floats
+
+        @return (list)
+        '''
+
+        if numpy is not None:
+            return self._data.ravel().tolist()
+        return self._data.tolist()
+
+    @property
+    def value( self ):
+
+        '''
+        Return points values
+
+        @return (list)
+        list of [ x, y, z ]
+        '''
+
+        flat = self.flat
+        return [ flat[i:i + 3] for i in xrange( 0, len( flat ), 3 ) ]
+
+    def __len__( self ):
+
+        if numpy is not None:
+            return len( self._data )
+        return len( self._data ) // 3
+
+    def __getitem__( self, index ):
+
+        if isinstance( index, slice ):
+            if numpy is not None:
+                return Point3Array._wrap( self._data[index] )
+            data = self._data
+            rows = xrange( *index.indices( len( self ) ) )
+            return Point3Array._wrap( array.array( 'd', itertools.chain.from_iterable(
+                data[3 * i:3 * i + 3] for i in rows ) ) )
+
+        n = len( self )
+        if index < 0:
+            index += n
+        if not 0 <= index < n:
+            raise IndexError( 'Point3Array index out of range' )
+        if numpy is not None:
+            return Point3( *self._data[index] )
+        return Point3( *self._data[3 * index:3 * index + 3] )
+
+    def __iter__( self ):
+
+        flat = self.flat
+        for i in xrange( 0, len( flat ), 3 ):
+            yield Point3( flat[i], flat[i + 1], flat[i + 2] )
+
+    def __repr__( self ):
+        return 'Point3Array(%r)' % self.value
+
+    def _operand( self, other ):
+
+        # other as a numpy operand, or as an iterable of flat values
+        # matching self buffer
+        if isinstance( other, Point3Array ):
+            if len( other ) != len( self ):
+                raise ValueError( 'Point3Array sizes differ: %d and %d' % ( len( self ), len( other ) ) )
+            return other._data
+        elif isinstance( other, Point3 ):
+            if numpy is not None:
+                return numpy.array( _xyz( other ) )
+            return itertools.cycle( _xyz( other ) )
+        else:
+            if numpy is not None:
+                return float( other )
+            return itertools.repeat( float( other ) )
+
+    def _apply( self, other, op ):
+
+        # component-wise operation with a Point3Array, a Point3 or a number
+        b = self._operand( other )
+        if numpy is not None:
+            return Point3Array._wrap( op( self._data, b ) )
+        return Point3Array._wrap( array.array( 'd', itertools.imap( op, self._data, b ) ) )
+
+    def __neg__( self ):
+        return self._apply( -1.0, operator.mul )
+
+    def __add__( self, other ):
+        return self._apply( other, operator.add )
+
+    __radd__ = __add__
+
+    def __sub__( self, other ):
+        return self._apply( other, operator.sub )
+
+    def __rsub__( self, other ):
+        return self._apply( other, lambda a, b: b - a )
+
+    def __mul__( self, other ):
+
+        # component-wise, or scaled by a number
+        return self._apply( other, operator.mul )
+
+    __rmul__ = __mul__
+
+    def __div__( self, other ):
+
+        # component-wise, or scaled by a number
+        return self._apply( other, operator.truediv )
+
+    __truediv__ = __div__
+
+    def __rdiv__( self, other ):
+        return self._apply( other, lambda a, b: b / a )
+
+    __rtruediv__ = __rdiv__
+
+    def __xor__( self, other ):
+
+        # cross product
+        return self.cross( other )
+
+    def __rxor__( self, other ):
+
+        # other ^ self
+        return -self.cross( other )
+
+    def max( self, other ):
+
+        '''
+        Returns the max of each components
+
+        @param other (Point3Array, Point3 or float)
+        @return (Point3Array)
+        '''
+
+        if numpy is not None:
+            return Point3Array._wrap( numpy.maximum( self._data, self._operand( other ) ) )
+        return self._apply( other, max )
+
+    def min( self, other ):
+
+        '''
+        Returns the min of each components
+
+        @param other (Point3Array, Point3 or float)
+        @return (Point3Array)
+        '''
+
+        if numpy is not None:
+            return Point3Array._wrap( numpy.minimum( self._data, self._operand( other ) ) )
+        return self._apply( other, min )
+
+    def dot( self, other ):
+
+        '''
+        Returns the dot product of each point with other
+
+        @param other (Point3Array or Point3)
+        @return (numpy array or array.array)
+        one float per point
+        '''
+
+        products = self._apply( other, operator.mul )._data
+        if numpy is not None:
+            return products.sum( axis = 1 )
+        return array.array( 'd', itertools.imap( lambda x, y, z: x + y + z,
+            products[0::3], products[1::3], products[2::3] ) )
+
+    def cross( self, other ):
+
+        '''
+        Returns the cross product of each point with other
+
+        @param other (Point3Array or Point3)
+        @return (Point3Array)
+        '''
+
+        b = self._operand( other )
+        if numpy is not None:
+            return Point3Array._wrap( numpy.cross( self._data, b ) )
 
-    def distance( self, other ):
-        '''
-        Returns the distance between self and other
+        a = self._data
+        b = list( itertools.islice( b, len( a ) ) )
+        result = array.array( 'd', a )
+        for i in xrange( 0, len( a ), 3 ):
+            ax, ay, az = a[i], a[i + 1], a[i + 2]
+            bx, by, bz = b[i], b[i + 1], b[i + 2]
+            result[i] = ay * bz - az * by
+            result[i + 1] = az * bx - ax * bz
+            result[i + 2] = ax * by - ay * bx
+        return Point3Array._wrap( result )
 
-        @return (float)
-        '''
-        return self._lp.distance( other._lp )
+    def squareLengths( self ):
 
-    def dot( self, other ):
         '''
-        Returns the dot product between self and other
+        Returns the square magnitude of each point
 
-        @return (float)
+        @return (numpy array or array.array)
         '''
-        return self._lp.dotproduct( other._lp )
 
-    def max( self, other ):
+        return self.dot( self )
+
+    def lengths( self ):
 
         '''
-        Returns the max of each components
+        Returns the magnitude of each point
 
-        @return (Point3)
-        (max(self.X, other.X), max(self.Y, other.Y), max(self.Z, other.Z)) 
+        @return (numpy array or array.array)
         '''
 
-        if isinstance( other, Point3 ):
-            return Point3.fromLua( self._lp.getmax( other._lp ) )
-        else:
-            return Point3.fromLua( self._lp.getmax( other ) )
+        squares = self.squareLengths()
+        if numpy is not None:
+            return numpy.sqrt( squares )
+        return array.array( 'd', [ math.sqrt( v ) for v in squares ] )
 
-    def min( self, other ):
+    def normalized( self ):
 
         '''
-        Returns the min of each components
+        Returns the normalized points, zero length points stay null
 
-        @return (Point3)
-        (min(self.X, other.X), min(self.Y, other.Y), min(self.Z, other.Z))
+        @return (Point3Array)
         '''
 
-        if isinstance( other, Point3 ):
-            return Point3.fromLua( self._lp.getmin( other._lp ) )
-        else:
-            return Point3.fromLua( self._lp.getmin( other ) )
+        lengths = self.lengths()
+        if numpy is not None:
+            # avoid dividing by 0, null points stay null
+            lengths[lengths == 0.0] = 1.0
+            return Point3Array._wrap( self._data / lengths[:, numpy.newaxis] )
+
+        a = self._data
+        result = array.array( 'd', a )
+        for i, length in enumerate( lengths ):
+            if length != 0.0:
+                j = 3 * i
+                result[j] = a[j] / length
+                result[j + 1] = a[j + 1] / length
+                result[j + 2] = a[j + 2] / length
+        return Point3Array._wrap( result )
+
+    def boundingBox( self ):
 
-    def normalized( self ):
         '''
-        Returns the normalized vector
+        Returns the bounding box of the points
 
-        @return (Point3)
+        @return (tuple)
+        ( min Point3, max Point3 )
+        @throws ValueError
+        if the array is empty
         '''
-        return Point3.fromLua( self._lp.getnormalized() )
+
+        if not len( self ):
+            raise ValueError( 'empty Point3Array has no bounding box' )
+
+        if numpy is not None:
+            return ( Point3( *self._data.min( axis = 0 ) ),
+                Point3( *self._data.max( axis = 0 ) ) )
+
+        a = self._data
+        xs, ys, zs = a[0::3], a[1::3], a[2::3]
+        return ( Point3( min( xs ), min( ys ), min( zs ) ),
+            Point3( max( xs ), max( ys ), max( zs ) ) )
 
 
 class PlugMeta( type ):
@@ -1546,6 +4680,10 @@ class Plug( object ):
 
     __metaclass__ = PlugMeta
 
+    __slots__ = ( '_parent', '_plug', '__weakref__' )
+
+    _luaGlobals = _luaGlobals
+
     def __init__( self, name, parent, luaGlobals = None ):
 
         '''
@@ -1557,16 +4695,11 @@ class Plug( object ):
         @param parent (Node)
         parent node
         @param luaGlobals (dict)
-        lua globals (default: retrieve lua globals)
+        ignored, lua globals are shared by all wrappers
         '''
 
         self._parent = parent
 
-        if luaGlobals:
-            self._luaGlobals = luaGlobals
-        else:
-            self._luaGlobals = lua.globals()
-
         parentLuaNode = parent._doc if not hasattr( parent, '_node' ) else parent._node
         self._plug = getattr( parentLuaNode, name )
 
@@ -1588,14 +4721,28 @@ class Plug( object ):
         '''
         Lua to python object
 
-        @return (ModificationContext)
+        @return (Plug)
+        '''
+
+        return cls.fromHandle( lplug )
+
+    @classmethod
+    def fromHandle( cls, luaPlug, parent = None ):
+
+        '''
+        Create a Plug from a lua plug, without node nor plug lookup
+
+        @param luaPlug (lua plug)
+        existing lua plug
+        @param parent (Node)
+        plug node if already known, else resolved on first use
+        @return (Plug)
         '''
 
-        # retrieve lua parent node
-        lplugParent = lplug.getnode( lplug )
-        n = Node( str( lplugParent.getpath( lplugParent )[0] ) )
-        # create Plug object
-        return Plug( str( lplug.getname( lplug ) ), n )
+        self = object.__new__( cls )
+        self._plug = luaPlug
+        self._parent = parent
+        return self
 
     @property
     def name( self ):
@@ -1612,11 +4759,14 @@ class Plug( object ):
         '''
         Parent node 
 
-        @return (Node)
+        @return (Node or Document)
         parent node
         '''
-        luaNode = self._plug.getnode( self._plug )
-        return Node( luaNode.getpath( luaNode )[0] )
+
+        if self._parent is None:
+            # Document or Node wrapper, as fromLua
+            self._parent = fromLua( self._plug.getnode( self._plug ) )
+        return self._parent
 
     def get( self ):
         '''
@@ -1624,9 +4774,36 @@ class Plug( object ):
 
         @return
         plug value
+
+        @note
+        values set in a batched ModificationContext are applied on flush,
+        the previous value is returned until then
         '''
         return fromLua( self._plug.get( self._plug ) )
 
+    def sample( self, frames ):
+
+        '''
+        Plug value at each frame, evaluated in a single lua call
+
+        The document Time is restored afterwards, no undo entry is added
+
+        @param frames (iterable)
+        frames to evaluate
+        @return (numpy array or list)
+        plug values by frame, a numpy array if numpy is available
+        and values are numbers
+
+        @code
+        >>> fovs = cam.Fov.sample( range( 101, 201 ) )
+        @endcode
+        '''
+
+        values = _samplePlugs( [ self ], frames )
+        if numpy is not None and isinstance( values, numpy.ndarray ):
+            return values[:, 0]
+        return [ row[0] for row in values ]
+
     def set( self, value ):
         '''
         Set plug value. 
@@ -1634,6 +4811,9 @@ class Plug( object ):
 
         @param value
         plug value
+
+        @note
+        inside a batched ModificationContext the value is set on flush
         '''
         mc = ModificationContext.get()
         mc.setPlug( self, value )
@@ -1658,6 +4838,9 @@ class Plug( object ):
 
         @param plug (Plug)
         plug object
+
+        @note
+        inside a batched ModificationContext the plugs are connected on flush
         '''
         mc = ModificationContext.get()
         mc.connect( self, plug )
@@ -1737,30 +4920,14 @@ class Plug( object ):
         luaPlug = self._plug
         plugs = []
 
-        # XXX: factorize code (cf dependencies method too)
-
         if source:
-
-            coLuaPlugs = luaPlug.getoutputs( luaPlug ) or []
-
-            for i in coLuaPlugs:
-
-                cLuaPlug = coLuaPlugs[i]
-                coLuaPlugParent = cLuaPlug.getnode( cLuaPlug )
-
-                p = Plug( str( cLuaPlug.getname( cLuaPlug ) ),
-                        Node( str( coLuaPlugParent.getpath( coLuaPlugParent )[0] ) ) )
-                plugs.append( p )
+            outputs = luaPlug.getoutputs( luaPlug ) or []
+            plugs.extend( Plug.fromHandle( outputs[i] ) for i in outputs )
 
         if destination:
-
-            coLuaPlug = luaPlug.getinput( luaPlug ) or []
-
-            coLuaPlugParent = coLuaPlug.getnode( coLuaPlug )
-
-            p = Plug( str( coLuaPlug.getname( coLuaPlug ) ),
-                    Node( str( coLuaPlugParent.getpath( coLuaPlugParent )[0] ) ) )
-            plugs.append( p )
+            inputPlug = luaPlug.getinput( luaPlug )
+            if inputPlug is not None:
+                plugs.append( Plug.fromHandle( inputPlug ) )
 
         return plugs
 
@@ -1780,36 +4947,47 @@ class Plug( object ):
         luaPlug = self._plug
         plugs = []
 
-        # XXX: factorize code
-
         if source:
             backDeps = luaPlug.getbackdependencies( luaPlug ) or []
+            plugs.extend( Plug.fromHandle( backDeps[i] ) for i in backDeps )
 
-            for i in backDeps:
+        if destination:
+            deps = luaPlug.getdependencies( luaPlug ) or []
+            plugs.extend( Plug.fromHandle( deps[i] ) for i in deps )
 
-                depLuaPlug = backDeps[i]
-                depLuaPlugParent = depLuaPlug.getnode( depLuaPlug )
+        return plugs
 
-                p = Plug( str( depLuaPlug.getname( depLuaPlug ) ),
-                        Node( str( depLuaPlugParent.getpath( depLuaPlugParent )[0] ) ) )
+    def upstream( self, depth = None ):
 
-                plugs.append( p )
+        '''
+        All plugs this plug value comes from: inputs and dependencies,
+        recursively (single lua call)
 
-        if destination:
+        @param depth (int)
+        maximum number of connections / dependencies to follow (default: no limit)
+        @return (list - Plug)
+        reached plugs, closest first
 
-            deps = luaPlug.getdependencies( luaPlug ) or []
+        @code
+        >>> feeding = Node( 'shader' ).Color.upstream()
+        @endcode
+        '''
 
-            for i in deps:
+        return _plugClosure( [ self ], True, depth )
 
-                depLuaPlug = deps[i]
-                depLuaPlugParent = depLuaPlug.getnode( depLuaPlug )
+    def downstream( self, depth = None ):
 
-                p = Plug( str( depLuaPlug.getname( depLuaPlug ) ),
-                        Node( str( depLuaPlugParent.getpath( depLuaPlugParent )[0] ) ) )
+        '''
+        All plugs this plug value goes to: outputs and back dependencies,
+        recursively (single lua call)
 
-                plugs.append( p )
+        @param depth (int)
+        maximum number of connections / dependencies to follow (default: no limit)
+        @return (list - Plug)
+        reached plugs, closest first
+        '''
 
-        return plugs
+        return _plugClosure( [ self ], False, depth )
 
 
 class Command( object ):
@@ -1920,6 +5098,10 @@ class Gtypes( object ):
             # }
     descRequired = ( 'enum', 'dynenum' )
 
+    __slots__ = ( 'type', 'value', '_gLuaType', '_luaValue', '__weakref__' )
+
+    _luaGlobals = _luaGlobals
+
     def __init__( self, type, value = None, **kwargs ):
 
         '''
@@ -1929,8 +5111,6 @@ class Gtypes( object ):
         if type not in Gtypes.validTypes:
             raise ValueError( 'unknown type %s, valid ones: %s' % ( type, Gtypes.validTypes ) )
 
-        self._luaGlobals = lua.globals()
-
         # save type and value
         self.type = type
         self.value = value
@@ -1972,6 +5152,750 @@ class Gtypes( object ):
         return self._gLuaType
 
 
+# plugs of the nodes below root (and root if a node) with their connections
+# and dependencies: plug names ('\n' separated 'node path.plug'), connection and
+# dependency edges as space separated 'source target' plug ids (from 0)
+_luaSources['pluggraph'] = '''
+function( root, refusedkeys )
+    local refused = refusedkeys()
+    local ids, names, count = {}, {}, 0
+    local connections, dependencies = {}, {}
+
+    local function id( plug )
+        local i = ids[plug]
+        if i == nil then
+            i = count
+            count = count + 1
+            ids[plug] = i
+            local node = plug:getnode()
+            local path = isclassof( node, 'Node' ) and node:getpath() or ''
+            names[count] = path .. '.' .. plug:getname()
+        end
+        return i
+    end
+
+    local stack, n = { root }, 1
+    while n > 0 do
+        local node = stack[n]
+        stack[n] = nil
+        n = n - 1
+
+        if isclassof( node, 'Node' ) then
+            for key, attr in pairs( node ) do
+                if type( key ) == 'string' and not refused[key] and isclassof( attr, 'Plug' ) then
+                    local target = id( attr )
+                    local input = attr:getinput()
+                    if input ~= nil then
+                        connections[#connections + 1] = id( input ) .. ' ' .. target
+                    end
+                    local deps = attr:getdependencies()
+                    if deps ~= nil then
+                        for _, dep in pairs( deps ) do
+                            dependencies[#dependencies + 1] = id( dep ) .. ' ' .. target
+                        end
+                    end
+                end
+            end
+        end
+
+        local children = node.Children
+        if children ~= nil then
+            for _, child in pairs( children ) do
+                if isclassof( child, 'Node' ) then
+                    n = n + 1
+                    stack[n] = child
+                end
+            end
+        end
+    end
+
+    return table.concat( names, '\\n' ), table.concat( connections, ' ' ), table.concat( dependencies, ' ' )
+end
+'''
+
+class PlugGraph( object ):
+
+    '''
+    Plugs and their connections / dependencies as integer arrays,
+    see Document.plugGraph
+
+    Plugs are identified by their index in names ('node path.Plug',
+    document plugs have an empty node path). Edges go from a plug to
+    the plugs its value flows to: connection output -> input and
+    dependency -> dependent plug; they are stored as compressed rows:
+    successors of plug i are targets[offsets[i]:offsets[i + 1]]
+
+    @code
+    >>> graph = Document().plugGraph()
+    >>> for cycle in graph.cycles():
+    ...     print [ graph.names[i] for i in cycle ]
+    @endcode
+    '''
+
+    # edge kinds
+    CONNECTION = 0
+    DEPENDENCY = 1
+
+    def __init__( self, names, connections, dependencies ):
+
+        '''
+        @param names (list - str)
+        plug names, by plug id
+        @param connections (sequence - int)
+        flat ( source, target ) plug id pairs
+        @param dependencies (sequence - int)
+        flat ( source, target ) plug id pairs
+        '''
+
+        size = len( names )
+        self.names = names
+        self._ids = None
+
+        edges = [ ( connections, PlugGraph.CONNECTION ), ( dependencies, PlugGraph.DEPENDENCY ) ]
+
+        counts = array.array( 'l', [ 0 ] ) * ( size + 1 )
+        for pairs, kind in edges:
+            for i in xrange( 0, len( pairs ), 2 ):
+                counts[pairs[i] + 1] += 1
+        for i in xrange( size ):
+            counts[i + 1] += counts[i]
+
+        self.offsets = array.array( 'l', counts )
+        self.targets = array.array( 'l', [ 0 ] ) * counts[size]
+        self.kinds = array.array( 'B', [ 0 ] ) * counts[size]
+
+        # counts: next free position of each row
+        for pairs, kind in edges:
+            for i in xrange( 0, len( pairs ), 2 ):
+                source = pairs[i]
+                position = counts[source]
+                self.targets[position] = pairs[i + 1]
+                self.kinds[position] = kind
+                counts[source] = position + 1
+
+    def __len__( self ):
+        return len( self.names )
+
+    @property
+    def edgeCount( self ):
+        return len( self.targets )
+
+    def id( self, name ):
+
+        '''
+        Id of a plug
+
+        @param name (str or Plug)
+        'node path.Plug' or Plug
+        @return (int)
+
+        @throws (KeyError)
+        raise an exception if the plug is not in the graph
+        '''
+
+        if self._ids is None:
+            self._ids = dict( ( n, i ) for i, n in enumerate( self.names ) )
+        if isinstance( name, Plug ):
+            # document plugs have no path, as in pluggraph lua helper
+            parent = name.parent
+            name = '%s.%s' % ( parent.longName if isinstance( parent, Node ) else '', name.name )
+        return self._ids[name]
+
+    def plug( self, i ):
+
+        '''
+        Plug of an id
+
+        @return (Plug)
+        '''
+
+        path, _, name = self.names[i].rpartition( '.' )
+        return Plug( name, Node( path ) if path else Document() )
+
+    def successors( self, i ):
+
+        '''
+        Plugs the value of plug i flows to
+
+        @return (array - int)
+        '''
+
+        return self.targets[self.offsets[i]:self.offsets[i + 1]]
+
+    def topologicalSort( self ):
+
+        '''
+        Plug ids ordered so that every plug comes before the plugs
+        its value flows to
+
+        @return (list - int)
+
+        @throws (ValueError)
+        raise an exception if the graph has cycles (see cycles)
+        '''
+
+        size = len( self.names )
+        offsets, targets = self.offsets, self.targets
+
+        inDegree = array.array( 'l', [ 0 ] ) * size
+        for target in targets:
+            inDegree[target] += 1
+
+        order = [ i for i in xrange( size ) if inDegree[i] == 0 ]
+        # order grows while being read
+        for v in order:
+            for position in xrange( offsets[v], offsets[v + 1] ):
+                w = targets[position]
+                inDegree[w] -= 1
+                if inDegree[w] == 0:
+                    order.append( w )
+
+        if len( order ) < size:
+            raise ValueError( 'plug graph has cycles (%d plugs involved), see cycles()'
+                    % ( size - len( order ) ) )
+        return order
+
+    def stronglyConnectedComponents( self ):
+
+        '''
+        Strongly connected components (iterative Tarjan)
+
+        @return (list - list - int)
+        plug id lists, a component comes after all the components it flows to
+        '''
+
+        size = len( self.names )
+        offsets, targets = self.offsets, self.targets
+
+        index = array.array( 'l', [ -1 ] ) * size
+        low = array.array( 'l', [ 0 ] ) * size
+        onStack = array.array( 'B', [ 0 ] ) * size
+        stack = []
+        components = []
+        counter = 0
+
+        for root in xrange( size ):
+            if index[root] != -1:
+                continue
+
+            index[root] = low[root] = counter
+            counter += 1
+            stack.append( root )
+            onStack[root] = 1
+            # explicit call stack: plug, next edge position
+            work = [ [ root, offsets[root] ] ]
+
+            while work:
+                frame = work[-1]
+                v, position = frame
+                if position < offsets[v + 1]:
+                    frame[1] = position + 1
+                    w = targets[position]
+                    if index[w] == -1:
+                        index[w] = low[w] = counter
+                        counter += 1
+                        stack.append( w )
+                        onStack[w] = 1
+                        work.append( [ w, offsets[w] ] )
+                    elif onStack[w] and index[w] < low[v]:
+                        low[v] = index[w]
+                    continue
+
+                work.pop()
+                if work:
+                    u = work[-1][0]
+                    if low[v] < low[u]:
+                        low[u] = low[v]
+
+                if low[v] == index[v]:
+                    component = []
+                    while True:
+                        w = stack.pop()
+                        onStack[w] = 0
+                        component.append( w )
+                        if w == v:
+                            break
+                    components.append( component )
+
+        return components
+
+    def cycles( self ):
+
+        '''
+        Plug loops: strongly connected components of more than one plug,
+        or plugs flowing to themselves
+
+        @return (list - list - int)
+        '''
+
+        return [ c for c in self.stronglyConnectedComponents()
+                if len( c ) > 1 or c[0] in self.successors( c[0] ) ]
+
+    def depths( self ):
+
+        '''
+        Longest path length from a source plug (no incoming edge) to each plug,
+        plugs of a cycle share the same depth
+
+        @return (array - int)
+        depth by plug id
+        '''
+
+        size = len( self.names )
+        offsets, targets = self.offsets, self.targets
+
+        components = self.stronglyConnectedComponents()
+        componentOf = array.array( 'l', [ 0 ] ) * size
+        for c, component in enumerate( components ):
+            for v in component:
+                componentOf[v] = c
+
+        depth = array.array( 'l', [ 0 ] ) * len( components )
+        # sources first
+        for c in xrange( len( components ) - 1, -1, -1 ):
+            d = depth[c] + 1
+            for v in components[c]:
+                for position in xrange( offsets[v], offsets[v + 1] ):
+                    other = componentOf[targets[position]]
+                    if other != c and depth[other] < d:
+                        depth[other] = d
+
+        return array.array( 'l', ( depth[componentOf[v]] for v in xrange( size ) ) )
+
+
+# write the nodes below root in bucket files directory/<bucket>.txt (see SceneCapture),
+# bucket is a hash of the node path
+# records (tab separated, values as python literals):
+# N path class / P path plug value / C path plug inputPath.inputPlug
+_luaSources['capturescene'] = r'''
+function( root, prefix, directory, buckets, refusedkeys )
+    local refused = refusedkeys()
+
+    local files = {}
+    for i = 1, buckets do
+        local f, err = io.open( directory .. '/' .. i .. '.txt', 'w' )
+        if f == nil then
+            for j = 1, i - 1 do
+                files[j]:close()
+            end
+            error( err )
+        end
+        files[i] = f
+    end
+
+    local function relative( path )
+        if prefix ~= '' and path:sub( 1, #prefix ) == prefix then
+            return path:sub( #prefix + 1 )
+        end
+        return path
+    end
+
+    local function bucket( path )
+        local h = 0
+        for i = 1, #path do
+            h = ( h * 31 + path:byte( i ) ) % 1000003
+        end
+        return h % buckets + 1
+    end
+
+    local escapes = { ['\\'] = '\\\\', ["'"] = "\\'", ['\n'] = '\\n', ['\r'] = '\\r', ['\t'] = '\\t' }
+    local function quote( s )
+        s = s:gsub( "[%c\\']", function( c )
+            return escapes[c] or string.format( '\\x%02x', c:byte() )
+        end )
+        return "'" .. s .. "'"
+    end
+
+    local function serialize( v, depth )
+        local t = type( v )
+        if t == 'nil' then
+            return 'None'
+        elseif t == 'boolean' then
+            return v and 'True' or 'False'
+        elseif t == 'number' then
+            if v ~= v then
+                return "'nan'"
+            elseif v == math.huge then
+                return '1e999'
+            elseif v == -math.huge then
+                return '-1e999'
+            end
+            return string.format( '%.17g', v )
+        elseif t == 'string' then
+            return quote( v )
+        elseif t == 'table' and getmetatable( v ) == nil and depth < 32 then
+            local items = {}
+            if #v > 0 then
+                for i = 1, #v do
+                    items[i] = serialize( v[i], depth + 1 )
+                end
+                return '[' .. table.concat( items, ', ' ) .. ']'
+            end
+            local keys = {}
+            for k in pairs( v ) do
+                keys[#keys + 1] = k
+            end
+            table.sort( keys, function( x, y ) return tostring( x ) < tostring( y ) end )
+            for i, k in ipairs( keys ) do
+                items[i] = serialize( k, depth + 1 ) .. ': ' .. serialize( v[k], depth + 1 )
+            end
+            return '{' .. table.concat( items, ', ' ) .. '}'
+        elseif t == 'table' and isclassof( v, 'Node' ) then
+            return quote( relative( v:getpath() ) )
+        end
+        return quote( tostring( v ) )
+    end
+
+    local ok, err = pcall( function()
+        local stack, n = { root }, 1
+        while n > 0 do
+            local node = stack[n]
+            stack[n] = nil
+            n = n - 1
+            local children = node.Children
+            if children ~= nil then
+                for _, child in pairs( children ) do
+                    if isclassof( child, 'Node' ) then
+                        n = n + 1
+                        stack[n] = child
+
+                        local path = relative( child:getpath() )
+                        local f = files[bucket( path )]
+                        f:write( 'N\t', path, '\t', getclassname( child ), '\n' )
+                        for key, attr in pairs( child ) do
+                            if type( key ) == 'string' and not refused[key] and isclassof( attr, 'Plug' ) then
+                                f:write( 'P\t', path, '\t', key, '\t', serialize( attr:get(), 0 ), '\n' )
+                                local input = attr:getinput()
+                                if input ~= nil then
+                                    local inputNode = input:getnode()
+                                    f:write( 'C\t', path, '\t', key, '\t',
+                                        relative( inputNode:getpath() ), '.', input:getname(), '\n' )
+                                end
+                            end
+                        end
+                    end
+                end
+            end
+        end
+    end )
+
+    for i = 1, buckets do
+        files[i]:close()
+    end
+    if not ok then
+        error( err )
+    end
+end
+'''
+
+# change reported by diffScenes
+SceneChange = collections.namedtuple( 'SceneChange', 'kind path detail' )
+
+class SceneCapture( object ):
+
+    '''
+    State of a scene (nodes, plug values and connections) written
+    lua side in bucket files, see diffScenes
+
+    Records are bucketed by a hash of the node path, so buckets have
+    about the same size whatever the node names are
+
+    @code
+    >>> before = SceneCapture()
+    >>> # ... edit the scene ...
+    >>> for change in diffScenes( before, Document() ): print change
+    >>> before.close()
+    @endcode
+    '''
+
+    def __init__( self, source = None, buckets = 64 ):
+
+        '''
+        Capture a scene
+
+        @param source (Document, Node, str or None)
+        current Document (default), nodes below a Node or a
+        .gproject file, loaded in a temporary node
+        @param buckets (int)
+        number of bucket files
+
+        @note
+        a file is loaded in a temporary node of the current Document,
+        created and deleted outside of any modification: the scene and
+        the undo stack are left unchanged
+        '''
+
+        self.buckets = buckets
+        self.directory = None
+        self.directory = tempfile.mkdtemp( prefix = 'pyGuerillaDiff' )
+
+        try:
+            if isinstance( source, basestring ):
+                self._captureFile( source )
+            elif isinstance( source, Node ):
+                self._capture( source._node, source.longName + '|' )
+            elif source is None or isinstance( source, Document ):
+                self._capture( lua.globals().Document, '' )
+            else:
+                raise TypeError( 'cannot capture a %s' % type( source ).__name__ )
+        except:
+            self.close()
+            raise
+
+    def _capture( self, luaRoot, prefix ):
+
+        _luaFunction( 'capturescene' )( luaRoot, prefix,
+                self.directory.replace( os.sep, '/' ), self.buckets,
+                _luaFunction( 'refusedkeys' ) )
+
+    def _captureFile( self, filename ):
+
+        # not undoable: nothing is left behind, in the scene nor
+        # in the undo stack
+        luaGlobals = lua.globals()
+        container = luaGlobals.SceneGraphNode( luaGlobals.Document, '__sceneCapture' )
+        try:
+            container.loadfile( container, filename )
+            self._capture( container, container.getpath( container )[0] + '|' )
+        finally:
+            container.delete( container )
+
+    def read( self, bucket ):
+
+        '''
+        Records of a bucket
+
+        @param bucket (int)
+        bucket index, from 1 to buckets
+        @return (tuple)
+        node path -> class name, node path -> { plug -> value (python literal) },
+        node path -> { plug -> input plug path }
+        '''
+
+        nodes = {}
+        plugs = collections.defaultdict( dict )
+        connections = collections.defaultdict( dict )
+
+        with open( os.path.join( self.directory, '%d.txt' % bucket ) ) as f:
+            for line in f:
+                kind, path, data = line.rstrip( '\n' ).split( '\t', 2 )
+                if kind == 'N':
+                    nodes[path] = data
+                else:
+                    name, value = data.split( '\t', 1 )
+                    if kind == 'P':
+                        plugs[path][name] = value
+                    else:
+                        connections[path][name] = value
+
+        return nodes, plugs, connections
+
+    def close( self ):
+
+        '''
+        Remove bucket files
+        '''
+
+        if self.directory is not None:
+            shutil.rmtree( self.directory, ignore_errors = True )
+            self.directory = None
+
+    def __enter__( self ):
+        return self
+
+    def __exit__( self, type, value, traceback ):
+        self.close()
+
+    def __del__( self ):
+
+        # capture never closed (ex. diffScenes iterator not consumed)
+        self.close()
+
+
+def _literal( text ):
+
+    '''
+    Python value of a captured plug value
+    '''
+
+    if text is None:
+        return None
+    try:
+        return ast.literal_eval( text )
+    except ( ValueError, SyntaxError ):
+        return text
+
+def _diffPlugs( path, valuesA, valuesB, inputsA, inputsB ):
+
+    '''
+    Plug changes of a node, path is the one of b (see diffScenes)
+    '''
+
+    for name in sorted( set( valuesA ) | set( valuesB ) ):
+        valueA, valueB = valuesA.get( name ), valuesB.get( name )
+        if valueA != valueB:
+            yield SceneChange( 'changed', '%s.%s' % ( path, name ),
+                    ( _literal( valueA ), _literal( valueB ) ) )
+
+    for name in sorted( set( inputsA ) | set( inputsB ) ):
+        inputA, inputB = inputsA.get( name ), inputsB.get( name )
+        if inputA != inputB:
+            if inputA is not None:
+                yield SceneChange( 'disconnected', '%s.%s' % ( path, name ), inputA )
+            if inputB is not None:
+                yield SceneChange( 'connected', '%s.%s' % ( path, name ), inputB )
+
+def _diffBucket( a, b, removed, added ):
+
+    '''
+    Changes between the records of a bucket (see diffScenes)
+
+    Nodes of a single capture are appended to removed or added as
+    ( path, class name, plug values, connections ), see _diffMoves
+    '''
+
+    nodesA, plugsA, connectionsA = a
+    nodesB, plugsB, connectionsB = b
+
+    # same path, same class
+    for path in sorted( nodesA ):
+        if nodesB.get( path ) == nodesA[path]:
+            for change in _diffPlugs( path, plugsA.get( path, {} ), plugsB.get( path, {} ),
+                    connectionsA.get( path, {} ), connectionsB.get( path, {} ) ):
+                yield change
+        else:
+            removed.append( ( path, nodesA[path], plugsA.get( path, {} ), connectionsA.get( path, {} ) ) )
+
+    for path in sorted( nodesB ):
+        if nodesA.get( path ) != nodesB[path]:
+            added.append( ( path, nodesB[path], plugsB.get( path, {} ), connectionsB.get( path, {} ) ) )
+
+def _diffMoves( removed, added ):
+
+    '''
+    Changes of the nodes of a single capture, once all buckets are
+    compared: a node is moved if another one has the same short name
+    and class, removed or added otherwise (see diffScenes)
+    '''
+
+    candidates = collections.defaultdict( list )
+    for record in sorted( added, key = operator.itemgetter( 0 ) ):
+        candidates[( record[0].rpartition( '|' )[2], record[1] )].append( record )
+
+    # same short name and class: moved
+    pairs = []
+    for record in sorted( removed, key = operator.itemgetter( 0 ) ):
+        path, className = record[:2]
+        matches = candidates.get( ( path.rpartition( '|' )[2], className ) )
+        if matches:
+            newRecord = matches.pop( 0 )
+            pairs.append( ( record, newRecord ) )
+            yield SceneChange( 'moved', path, newRecord[0] )
+        else:
+            yield SceneChange( 'removed', path, className )
+
+    for key in sorted( candidates ):
+        for record in candidates[key]:
+            yield SceneChange( 'added', record[0], key[1] )
+
+    for ( pathA, classA, valuesA, inputsA ), ( pathB, classB, valuesB, inputsB ) in pairs:
+        for change in _diffPlugs( pathB, valuesA, valuesB, inputsA, inputsB ):
+            yield change
+
+def diffScenes( a, b, buckets = 64 ):
+
+    '''
+    Compare two scene states
+
+    Both states are captured lua side in bucket files (see SceneCapture)
+    then compared one bucket at a time, so memory usage is bounded by
+    the bucket size and the number of added or removed nodes, not by
+    the scene size
+
+    @param a (SceneCapture, Document, Node or str)
+    reference state: a capture, the current Document, nodes below a Node
+    or a .gproject file
+    @param b (SceneCapture, Document, Node or str)
+    compared state
+    @param buckets (int)
+    number of buckets for the captures made here
+    @return (iterator)
+    iterator of SceneChange( kind, path, detail ), states are captured
+    when diffScenes is called:
+    - 'added' / 'removed', node path, class name
+    - 'moved', old node path, new node path (same short name and class)
+    - 'changed', 'path.Plug', ( old value, new value ) (None for a missing plug)
+    - 'connected' / 'disconnected', 'path.Plug', input 'path.Plug'
+    plug paths are the ones of b
+
+    @throws (ValueError)
+    raise an exception if captures do not have the same number of buckets
+
+    @note
+    descendants of a moved node are reported as moved too,
+    connections are compared by path
+
+    @code
+    >>> for change in diffScenes( 'lighting_v1.gproject', 'lighting_v2.gproject' ):
+    ...     print change.kind, change.path, change.detail
+    @endcode
+    '''
+
+    # capture now, not on first next()
+    captures = []
+    owned = []
+    try:
+        for state in ( a, b ):
+            if not isinstance( state, SceneCapture ):
+                state = SceneCapture( state, buckets )
+                owned.append( state )
+            captures.append( state )
+
+        captureA, captureB = captures
+        if captureA.buckets != captureB.buckets:
+            raise ValueError( 'captures have different bucket counts: %d and %d'
+                    % ( captureA.buckets, captureB.buckets ) )
+    except:
+        for capture in owned:
+            capture.close()
+        raise
+
+    return _diffCaptures( captureA, captureB, owned )
+
+def _diffCaptures( captureA, captureB, owned ):
+
+    '''
+    Changes between two captures, bucket by bucket (see diffScenes)
+
+    @param owned (list - SceneCapture)
+    captures to close once done
+    '''
+
+    try:
+        # nodes of a single capture, matched once all buckets are read
+        removed, added = [], []
+        for bucket in xrange( 1, captureA.buckets + 1 ):
+            for change in _diffBucket( captureA.read( bucket ), captureB.read( bucket ), removed, added ):
+                yield change
+        for change in _diffMoves( removed, added ):
+            yield change
+    finally:
+        for capture in owned:
+            capture.close()
+
+
+# nodeinfo lua helper kind -> python class
+_nodeKindClasses = {
+        'Camera': Camera,
+        'ReferenceBase': Reference,
+        'Node': Node,
+        }
+
+# wrapped objects know their lua counterpart
+for _cls in ( ModificationContext, Document, Node, Point3, Point3Array, Plug, Gtypes, LuaDict, LuaList ):
+    registerToLua( _cls, _objectToLua )
+
+
 def blast( camera, imgPath, **kwargs ):
 
     '''
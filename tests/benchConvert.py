@@ -0,0 +1,55 @@
+"""
+Copyright (c) 2013 Digital District
+----------------------------------------------------
+
+Benchmark of lua conversions: explicit stack engine (toLua, fromLua)
+against the former recursive conversion
+
+usage: python tests/benchConvert.py
+
+authors: sylvain delhomme <sylvain.delhomme@digital-district.ca>
+"""
+
+import timeit
+
+import lua
+from pyGuerilla import fromLua, toLua
+
+# recursive conversion functions (before explicit stack engine)
+
+def recursiveToLua(obj):
+
+	if isinstance(obj, dict):
+		luaTbl = lua.eval('{}')
+		for k, v in obj.iteritems():
+			luaTbl[k] = recursiveToLua(v)
+		return luaTbl
+	elif isinstance(obj, (list, tuple)):
+		luaTbl = lua.eval('{}')
+		for i, v in enumerate(obj):
+			luaTbl[i + 1] = recursiveToLua(v)
+		return luaTbl
+	return obj
+
+def recursiveFromLua(obj):
+
+	lg = lua.globals()
+	if lg.type(obj) != 'table':
+		return obj
+	if len(obj) == 0:
+		return dict((k, recursiveFromLua(obj[k])) for k in obj)
+	return [recursiveFromLua(obj[i + 1]) for i in xrange(len(obj))]
+
+data = [{'name': 'item%d' % i, 'tags': ['a', 'b', {'c': i}]} for i in xrange(200)]
+
+def bench(name, old, new):
+
+	old = min(timeit.repeat(old, number=5, repeat=3))
+	new = min(timeit.repeat(new, number=5, repeat=3))
+	print '%s recursive: %.4fs explicit stack: %.4fs' % (name, old, new)
+
+if __name__ == '__main__':
+
+	bench('toLua', lambda: recursiveToLua(data), lambda: toLua(data))
+	t = toLua(data)
+	bench('fromLua', lambda: recursiveFromLua(t), lambda: fromLua(t))
@@ -0,0 +1,200 @@
+"""
+Copyright (c) 2013 Digital District
+----------------------------------------------------
+
+Nose tests for toLua and fromLua functions
+
+authors: sylvain delhomme <sylvain.delhomme@digital-district.ca>
+"""
+
+import array
+import math
+
+import lua
+import pyGuerilla
+from pyGuerilla import Document, Node, Plug, fromLua, toLua, registerToLua, LuaDict, LuaList
+from nose.tools import raises
+
+class TestFromLua(object):
+
+	def setup(self):
+		Document().new(warn=False)
+
+	def testClassCache(self):
+
+		lg = lua.globals()
+		assert isinstance(fromLua(lg._('RenderPass')), Node)
+		assert pyGuerilla._classCache['RenderPass'] is Node
+		assert isinstance(fromLua(lg._('RenderPass.RenderPassCamera')), Plug)
+
+	def testClassCacheReset(self):
+
+		fromLua(lua.globals()._('RenderPass'))
+		Document().new(warn=False)
+		assert not pyGuerilla._classCache
+
+class Color(object):
+
+	def __init__(self, r, g, b):
+		self.rgb = [r, g, b]
+
+class TestToLua(object):
+
+	@classmethod
+	def setup_class(cls):
+		Document().new(warn=False)
+
+	def testNative(self):
+
+		assert toLua(16) == 16
+		assert toLua('bou') == 'bou'
+		assert toLua(None) is None
+
+	def testNestedContainers(self):
+
+		t = toLua({'a': [1, (2, 3)], 'b': {'c': 4}})
+		assert t.a[2][2] == 3
+		assert t.b.c == 4
+
+	def testWrappers(self):
+
+		n = Node('RenderPass')
+		assert toLua(n) == n._node
+		assert toLua([n])[1] == n._node
+
+	def testRegister(self):
+
+		registerToLua(Color, lambda c: toLua(c.rgb))
+		t = toLua([Color(0, 1, 2)])
+		assert t[1][3] == 2
+
+class TestNumbers(object):
+
+	@classmethod
+	def setup_class(cls):
+		Document().new(warn=False)
+
+	def testFlat(self):
+
+		values = [0.1, 2, -3.5, 1e-12]
+		assert fromLua(toLua(values)) == values
+
+	def testMatrix(self):
+
+		m = [[1, 0, 0, 0], [0, 1, 0, 0], [0, 0, 1, 0], [0.5, 2, 3, 1]]
+		t = toLua(m)
+		assert t[4][1] == 0.5
+		assert fromLua(t) == m
+
+	def testPoints(self):
+
+		lg = lua.globals()
+		t = lua.eval('{}')
+		t[1] = lg.point3.create(1, 2, 3)
+		t[2] = lg.point3.create(4, 5, 6)
+		points = fromLua(t)
+		assert [p.value for p in points] == [[1, 2, 3], [4, 5, 6]]
+
+	def testArray(self):
+
+		t = toLua(array.array('d', [1.5, 2.5]))
+		assert t[2] == 2.5
+
+	def testNonFinite(self):
+
+		inf = float('inf')
+		values = fromLua(toLua([1.5, inf, -inf, float('nan')]))
+		assert values[:3] == [1.5, inf, -inf]
+		assert math.isnan(values[3])
+
+		rows = fromLua(toLua([[1, inf], [float('nan'), 2]]))
+		assert rows[0] == [1, inf] and rows[1][1] == 2
+		assert math.isnan(rows[1][0])
+
+	def testMixed(self):
+
+		assert fromLua(toLua([1, 'a', [2, 3]])) == [1, 'a', [2, 3]]
+
+class TestLazy(object):
+
+	def testDict(self):
+
+		d = fromLua(lua.eval('{a={1, 2, {b=3}}, c="d"}'), lazy=True)
+		assert isinstance(d, LuaDict)
+		assert isinstance(d['a'], LuaList)
+		assert d['a'][2]['b'] == 3
+		assert d['a'] is d['a']
+		assert sorted(d.keys()) == ['a', 'c']
+		assert 'e' not in d
+
+	def testList(self):
+
+		l = fromLua(lua.eval('{1, "a", 3}'), lazy=True)
+		assert len(l) == 3
+		assert l[-1] == 3
+		assert l[:2] == [1, 'a']
+		assert l == [1, 'a', 3]
+
+	def testReadOnly(self):
+
+		d = fromLua(lua.eval('{a=1}'), lazy=True)
+		try:
+			d['a'] = 2
+		except TypeError:
+			pass
+		else:
+			assert False, 'LuaDict should be read-only'
+
+class TestEngine(object):
+
+	def testSharedTable(self):
+
+		t = lua.eval('{}')
+		t.a = lua.eval('{1, "b"}')
+		t.b = t.a
+		d = fromLua(t)
+		assert d['a'] is d['b']
+
+	def testLuaCycle(self):
+
+		t = lua.eval('{}')
+		t.me = t
+		d = fromLua(t)
+		assert d['me'] is d
+
+	def testPythonCycle(self):
+
+		l = [1, 'a']
+		l.append(l)
+		t = toLua(l)
+		assert t[3][3][2] == 'a'
+
+	def testDeepNesting(self):
+
+		l = ['a']
+		for i in xrange(5000):
+			l = [l, 'b']
+		t = toLua(l, maxDepth=6000)
+		assert fromLua(t, maxDepth=6000)[1] == 'b'
+
+	@raises(RuntimeError)
+	def testMaxDepth(self):
+
+		l = ['a']
+		for i in xrange(20):
+			l = [l]
+		toLua(l, maxDepth=10)
+
+	def testGeneratorRows(self):
+
+		# rows are freed once converted, their id may be reused
+		t = toLua([i, 'a'] for i in xrange(4))
+		assert [t[i + 1][1] for i in xrange(4)] == [0, 1, 2, 3]
+
+	def testToStringTables(self):
+
+		t = lua.eval('''(function()
+			local mt = {__tostring = function() return 'same' end}
+			return {setmetatable({1, 'a'}, mt), setmetatable({2, 'b'}, mt)}
+		end)()''')
+		assert fromLua(t) == [[1, 'a'], [2, 'b']]
@@ -10,8 +10,8 @@ authors: sylvain delhomme <sylvain.delhomme@digital-district.ca>
 import tempfile
 import os
 import shutil
-from pyGuerilla import Document, Node
-from nose.tools import raises
+from pyGuerilla import Document, Node, ModificationContext, Point3, SceneCapture, SceneChange, diffScenes, PlugGraph
+from nose.tools import raises, assert_raises
 
 class TestDocument(object):
 
@@ -67,3 +67,239 @@ class TestDocument(object):
 		self.folders.append(sceneFolder)
 		return os.path.join(sceneFolder, 'blast.gproject')
 	
+
+	def testWalk(self):
+
+		n = Node.createNode('docWalk')
+		c = Node.createNode('docWalkChild', 'SceneGraphNode', n)
+		nodes = list(Document().walk())
+		assert n in nodes and c in nodes
+		assert c not in Document().walk(maxDepth=1)
+		assert c not in Document().walk(prune=lambda path: path == 'docWalk')
+
+	def testFind(self):
+
+		doc = Document()
+		chars = Node.createNode('chars')
+		a = Node.createNode('a_geo', 'SceneGraphNode', chars)
+		b = Node.createNode('b_geo', 'SceneGraphNode', chars)
+		c = Node.createNode('c_ctl', 'SceneGraphNode', chars)
+		cam = Node.createNode('cam_geo', 'Camera', chars)
+
+		assert doc.find('chars|*_geo') == [a, b, cam]
+		assert doc.find('chars|*_geo', type='SceneGraphNode') == [a, b, cam]
+		assert doc.find('chars|*_geo', type='Camera') == [cam]
+		assert doc.find('chars|c_ctl') == [c]
+		assert doc.find(r'chars\|[ab]_', regex=True) == [a, b]
+		assert doc.find('chars|dummy*') == []
+
+		# incremental updates
+		d = Node.createNode('d_geo', 'SceneGraphNode', chars)
+		assert doc.find('chars|d_*') == [d]
+		d.renameNode('e_geo')
+		assert doc.find('chars|d_*') == []
+		assert doc.find('chars|e_*') == [d]
+		with ModificationContext() as mc:
+			mc.deleteNode(d)
+		assert doc.find('chars|e_*') == []
+		chars.renameNode('charsRenamed')
+		assert doc.find('chars|*') == []
+		assert doc.find('charsRenamed|*_ctl') == [c]
+
+		# edits made in lua, outside of any ModificationContext
+		luaDoc = doc._doc
+		luaMod = luaDoc.getmodifier(luaDoc)
+		luaMod.renamenode(c._node, 'd_ctl')
+		assert doc.find('charsRenamed|*_ctl') == [c]
+		assert c.longName == 'charsRenamed|d_ctl'
+		luaMod.createnode(chars._node, 'SceneGraphNode', 'e_ctl')
+		assert doc.find('charsRenamed|e_ctl') == []
+		assert [n.name for n in doc.find('charsRenamed|e_ctl', refresh=True)] == ['e_ctl']
+
+	def testWorldTransforms(self):
+
+		doc = Document()
+		grp = Node.createNode('xforms')
+		a = Node.createNode('a', 'SceneGraphNode', grp)
+		cam = Node.createNode('cam', 'Camera', grp)
+
+		identity = [1, 0, 0, 0, 0, 1, 0, 0, 0, 0, 1, 0, 0, 0, 0, 1]
+		matrices = doc.worldMatrices([a, cam]).tolist()
+		if len(matrices) == 2:
+			# numpy N x 16 array
+			matrices = matrices[0] + matrices[1]
+		assert matrices == identity * 2
+
+		positions = doc.worldPositions([a, cam])
+		assert positions.value == [[0, 0, 0], [0, 0, 0]]
+		assert len(doc.worldPositions([])) == 0
+		assert_raises(TypeError, doc.worldPositions, [doc.Preferences])
+
+		# matrix layout: translation in the 4th row
+		with ModificationContext() as mod:
+			t = mod.createNode('xform', 'TransformEuler', grp)
+			mod.connect(grp.Transform, t.Out)
+		t.TX.set(1)
+		t.TY.set(2)
+		t.TZ.set(3)
+		cam.setWorldPositionTargetUp(Point3(5, 0, 0), Point3(5, 0, -1), Point3(0, 1, 0))
+
+		assert doc.worldPositions([a, cam]).value == [[1, 2, 3], [5, 0, 0]]
+		matrix = doc.worldMatrices([a]).tolist()
+		if len(matrix) == 1:
+			matrix = matrix[0]
+		assert matrix[12:] == [1, 2, 3, 1]
+
+	def testSample(self):
+
+		doc = Document()
+		doc.Time.set(10)
+		n = Node.createNode('sampled')
+		n.createPlug('Constant', dataType='float')
+		n.Constant.set(4)
+
+		values = doc.sample([doc.Time, n.Constant], 1, 5, 2)
+		assert [list(row) for row in values] == [[1, 4], [3, 4], [5, 4]]
+		assert len(doc.sample([doc.Time], 1, 2, 0.25)) == 5
+		assert len(doc.sample([doc.Time], 2, 1)) == 0
+		assert doc.Time.get() == 10
+		assert_raises(ValueError, doc.sample, [doc.Time], 1, 5, 0)
+
+		# animated plug, evaluated at each frame
+		n.createPlug('Animated', dataType='float')
+		n.Animated.connect(doc.Time)
+		values = doc.sample([n.Animated], 1, 4)
+		assert [list(row) for row in values] == [[1], [2], [3], [4]]
+		assert list(n.Animated.sample([8, 2])) == [8, 2]
+		assert n.Animated.get() == 10
+
+		# recorded values are applied first
+		with ModificationContext(batch=True) as mod:
+			mod.setPlug(n.Constant, 6)
+			assert list(doc.sample([n.Constant], 1, 1)[0]) == [6]
+		assert doc.Time.get() == 10
+
+
+class TestDiffScenes(object):
+
+	@classmethod
+	def setup_class(cls):
+		Document().new(warn=False)
+
+	def testSame(self):
+		assert list(diffScenes(Document(), Document())) == []
+
+	def testDiff(self):
+
+		grp = Node.createNode('diffGrp')
+		# diffMoved lands in another bucket once moved
+		other = Node.createNode('diffTarget')
+		moved = Node.createNode('diffMoved', 'SceneGraphNode', grp)
+		removed = Node.createNode('diffRemoved', 'SceneGraphNode', grp)
+		movedValue = moved.createPlug('diffMovedValue')
+		movedValue.set('a')
+		value = grp.createPlug('diffValue')
+		value.set('foo')
+		t1 = Node.createNode('diffT1', 'TransformEuler', grp)
+		t2 = Node.createNode('diffT2', 'TransformEuler', grp)
+
+		with SceneCapture(buckets=4) as before:
+			with ModificationContext() as mc:
+				mc.moveNode(moved, other)
+				movedValue.set('b')
+				mc.deleteNode(removed)
+				mc.createNode('diffAdded', 'SceneGraphNode', grp)
+				value.set('bar\tbaz')
+				mc.connectMany([(t1.TX, t2.Out)])
+
+			changes = set(diffScenes(before, Document(), buckets=4))
+
+		assert SceneChange('moved', 'diffGrp|diffMoved', 'diffTarget|diffMoved') in changes
+		assert SceneChange('removed', 'diffGrp|diffRemoved', 'SceneGraphNode') in changes
+		assert SceneChange('added', 'diffGrp|diffAdded', 'SceneGraphNode') in changes
+		assert SceneChange('changed', 'diffGrp.diffValue', ('foo', 'bar\tbaz')) in changes
+		assert SceneChange('connected', 'diffGrp|diffT1.TX', 'diffGrp|diffT2.Out') in changes
+		assert SceneChange('changed', 'diffTarget|diffMoved.diffMovedValue', ('a', 'b')) in changes
+		assert len(changes) == 6
+
+	def testEagerCapture(self):
+
+		with SceneCapture(buckets=4) as after:
+			changes = diffScenes(Document(), after, buckets=4)
+			Node.createNode('diffLate')
+			assert list(changes) == []
+
+	def testCaptureFile(self):
+
+		children = sorted(n.name for n in Document().children())
+		filename = os.path.join(tempfile.gettempdir(), 'diffFile.gproject')
+		with SceneCapture(filename, buckets=4) as capture:
+			records = [capture.read(bucket) for bucket in range(1, 5)]
+		assert any(nodes.get('diffFile') == 'SceneGraphNode' for nodes, plugs, connections in records)
+
+		# loaded in a temporary node, removed once captured
+		assert sorted(n.name for n in Document().children()) == children
+
+	@raises(ValueError)
+	def testBuckets(self):
+		with SceneCapture(buckets=4) as before:
+			list(diffScenes(before, Document(), buckets=8))
+
+
+class TestPlugGraph(object):
+
+	@classmethod
+	def setup_class(cls):
+		Document().new(warn=False)
+
+	def testGraph(self):
+
+		with ModificationContext() as mod:
+			grp = mod.createNode('graphGrp')
+			a = mod.createNode('a', 'TransformEuler', grp)
+			b = mod.createNode('b', 'TransformEuler', grp)
+			c = mod.createNode('c', 'TransformEuler', grp)
+			mod.connect(a.TX, b.Out)
+			mod.addDependency(b.Out, b.TX)
+			mod.connect(b.TX, c.Out)
+
+		graph = Document().plugGraph(grp)
+		ids = [graph.id(p) for p in ('graphGrp|c.Out', 'graphGrp|b.TX', 'graphGrp|b.Out', 'graphGrp|a.TX')]
+		assert graph.id(a.TX) == ids[-1]
+		assert graph.edgeCount == 3
+		assert list(graph.successors(ids[0])) == [ids[1]]
+		assert graph.kinds[graph.offsets[ids[1]]] == PlugGraph.DEPENDENCY
+		assert graph.plug(ids[-1]).name == 'TX'
+
+		order = graph.topologicalSort()
+		assert sorted(order) == range(len(graph))
+		positions = [order.index(i) for i in ids]
+		assert positions == sorted(positions)
+
+		depths = graph.depths()
+		assert [depths[i] for i in ids] == [0, 1, 2, 3]
+		assert graph.cycles() == []
+
+		# accidental loop
+		with ModificationContext() as mod:
+			mod.addDependency(b.TX, b.Out)
+
+		graph = Document().plugGraph(grp)
+		assert_raises(ValueError, graph.topologicalSort)
+		cycles = graph.cycles()
+		assert len(cycles) == 1
+		assert sorted(graph.names[i] for i in cycles[0]) == ['graphGrp|b.Out', 'graphGrp|b.TX']
+		depths = graph.depths()
+		assert depths[graph.id(b.TX)] == depths[graph.id(b.Out)] == 1
+		assert depths[graph.id(a.TX)] == 2
+
+	def testDocumentPlugs(self):
+
+		doc = Document()
+		with ModificationContext() as mod:
+			t = mod.createNode('graphTime', 'TransformEuler')
+			mod.connect(t.TX, doc.Time)
+
+		graph = doc.plugGraph(t)
+		assert graph.id(doc.Time) == graph.id('.Time')
+		assert isinstance(graph.plug(graph.id(doc.Time)).parent, Document)
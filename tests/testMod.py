@@ -10,7 +10,8 @@ authors: sylvain delhomme <sylvain.delhomme@digital-district.ca>
 import os
 
 import lua
-from pyGuerilla import ModificationContext, Document, Node, toLua, fromLua, Gtypes
+import pyGuerilla
+from pyGuerilla import ModificationContext, Document, Node, Point3, toLua, fromLua, Gtypes, PendingNode
 
 from nose.tools import assert_raises, raises
 
@@ -51,6 +52,158 @@ class TestModificationContext(object):
 				
 			assert not missingFuncs, os.linesep.join(missingFuncs)
 	
+	def testGetReusesContext(self):
+
+		with ModificationContext() as mod:
+			assert ModificationContext.get() is mod
+			with ModificationContext() as mod2:
+				assert ModificationContext.get() is mod2
+			assert ModificationContext.get() is mod
+
+		assert ModificationContext.get() is not mod
+
+	def testBatch(self):
+
+		with ModificationContext(batch=True) as mod:
+			grp = mod.createNode('grp')
+			xform = mod.createNode('xform', 'TransformEuler', grp)
+			mod.connect(grp.Transform, xform.Out)
+			mod.setPlug(xform.TY, 2.0)
+			p = mod.createPlug(grp, 'bar', dataType='float')
+			mod.setPlug(p, 3.0)
+			assert isinstance(grp, PendingNode)
+			assert_raises(RuntimeError, lambda: grp.node)
+
+		assert grp.node.longName == xform.node.parent.longName
+		assert grp.Transform.isConnected()
+		assert xform.TY.get() == 2.0
+		assert grp.bar.get() == 3.0
+
+	def testBatchExistingNode(self):
+
+		n = Node.createNode('batchExisting')
+		src = Node.createNode('batchSrc', 'TransformEuler')
+		with ModificationContext(batch=True) as mod:
+			p = mod.createPlug(n, 'x', dataType='float')
+			mod.setPlug(p, 4.0)
+			q = mod.createPlug(src, 'y', dataType='float')
+			mod.connect(q, src.Out)
+
+		assert n.x.get() == 4.0
+		assert src.y.isConnected()
+
+	def testBatchFlush(self):
+
+		with ModificationContext(batch=True) as mod:
+			n = mod.createNode('foo')
+			mod.flush()
+			assert n.isResolved
+			mod.renameNode(n, 'fooRenamed')
+
+		assert n.name == 'fooRenamed'
+
+	def testBatchUnknownNode(self):
+
+		def create():
+			with ModificationContext(batch=True) as mod:
+				mod.createNode('foo', 'dummyDummy')
+
+		assert_raises(RuntimeError, create)
+
+	def testCreateNodesFromSpec(self):
+
+		spec = {
+			'name': 'grp',
+			'children': [
+				{'name': 'xform', 'type': 'TransformEuler', 'plugs': {'TY': 2.0}},
+				{'name': 'geo', 'plugs': {'tag': Gtypes('float', 1.5)}},
+				],
+			'connections': [('grp.Transform', 'grp|xform.Out')],
+			}
+
+		with ModificationContext() as mod:
+			nodes = mod.createNodes(spec)
+
+		assert sorted(nodes) == ['grp', 'grp|geo', 'grp|xform']
+		assert nodes['grp|xform'].parent.longName == nodes['grp'].longName
+		assert nodes['grp|xform'].TY.get() == 2.0
+		assert nodes['grp|geo'].tag.get() == 1.5
+		assert nodes['grp'].Transform.isConnected()
+
+	def testCreateNodesInBatch(self):
+
+		with ModificationContext(batch=True) as mod:
+			nodes = mod.createNodes([{'name': 'a'}, {'name': 'b', 'type': 'TransformEuler'}])
+			assert isinstance(nodes['a'], PendingNode)
+
+		assert nodes['b'].node.type == 'TransformEuler'
+
+	def testCreateNodesInvalidSpec(self):
+
+		with ModificationContext(batch=True) as mod:
+			mod.createNode('kept')
+			try:
+				mod.createNodes([{'name': 'partial'}, {'type': 'SceneGraphNode'}])
+			except RuntimeError as e:
+				assert 'spec 1' in str(e)
+			else:
+				assert False, 'RuntimeError not raised'
+
+		assert Node('kept')
+		assert_raises(ValueError, Node, 'partial')
+
+		# nested spec
+		with ModificationContext() as mod:
+			try:
+				mod.createNodes({'name': 'specGrp', 'children': [{'name': 'a'}, {}]})
+			except RuntimeError as e:
+				assert "spec 1 in 'specGrp' children" in str(e)
+			else:
+				assert False, 'RuntimeError not raised'
+		assert_raises(ValueError, Node, 'specGrp')
+
+	def testSetGetPlugs(self):
+
+		with ModificationContext() as mod:
+			n = mod.createNode('foo')
+			a = mod.createPlug(n, 'a', dataType='float')
+			b = mod.createPlug(n, 'b', dataType='string')
+			mod.setPlugs({a: 2.5, b: 'bar'})
+			assert mod.getPlugs([b, a]) == ['bar', 2.5]
+			mod.setPlugs([(a, 3)])
+			assert mod.getPlugs([a]) == [3]
+			assert mod.getPlugs([]) == []
+
+	def testConnectMany(self):
+
+		with ModificationContext() as mod:
+			n = mod.createNode('foo')
+			t1 = mod.createNode('xform1', 'TransformEuler', n)
+			t2 = mod.createNode('xform2', 'TransformEuler', n)
+			mod.connectMany([(t1.TX, t2.Out), (t1.TY, t2.Out)])
+			assert t1.TX.isConnected() and t1.TY.isConnected()
+			mod.disconnectMany([(t1.TX, t2.Out), (t1.TY, t2.Out)])
+			assert not t1.TX.isConnected()
+
+	def testConnectManyUntyped(self):
+
+		with ModificationContext() as mod:
+			n = mod.createNode('foo')
+			t = mod.createNode('xform', 'TransformEuler', n)
+			untyped = Node('RenderPass').RenderPassCamera
+			assert_raises(RuntimeError, mod.connectMany,
+					[(t.TX, t.Out), (untyped, t.Out)])
+			assert not t.TX.isConnected()
+
+	def testDependencies(self):
+
+		with ModificationContext() as mod:
+			n = mod.createNode('foo', 'TransformEuler')
+			mod.addDependencies([(n.TX, n.TY), (n.TX, n.TZ)])
+			assert n.TX.hasDependencies()
+			mod.removeDependencies([(n.TX, None)])
+			assert not n.TX.hasDependencies()
+
 	def testCreateUnknownNode(self):
 		
 		with ModificationContext() as mod:
@@ -172,6 +325,76 @@ class TestModificationContext(object):
 				assert pn not in nodePlugNames, 'plug %s still in node %s' % (pn,
 						n.name)
 	
+	def testReconcile(self):
+
+		with ModificationContext() as mod:
+			root = mod.createNode('recRoot')
+			keep = mod.createNode('keep', 'SceneGraphNode', root)
+			mod.createPlug(keep, 'val', dataType=Gtypes('string', 'x'))
+			geo = mod.createNode('geo', 'SceneGraphNode', keep)
+			old = mod.createNode('old', 'SceneGraphNode', root)
+			oldChild = mod.createNode('child', 'SceneGraphNode', old)
+			oldT = mod.createNode('oldT', 'TransformEuler', root)
+			gone = mod.createNode('gone', 'Camera', root)
+			src = mod.createNode('src', 'TransformEuler', root)
+
+		target = [
+			{'name': 'keep', 'plugs': {'val': 'y'}, 'children': [
+				{'name': 'sub', 'children': [{'name': 'geo'}]}]},
+			{'name': 'renamed', 'children': [{'name': 'child'}]},
+			{'name': 'xf', 'type': 'TransformEuler',
+				'connections': [('xf.TX', 'src.Out')]},
+			{'name': 'src', 'type': 'TransformEuler'},
+			]
+
+		with ModificationContext() as mod:
+			edits = mod.reconcile(target, root)
+
+		assert sorted(edits) == sorted([
+			('createNode', 'keep|sub', 'SceneGraphNode'),
+			('moveNode', 'keep|geo', 'keep|sub|geo'),
+			('deleteNode', 'gone'),
+			('renameNode', 'old', 'renamed'),
+			('renameNode', 'oldT', 'xf'),
+			('setPlug', 'keep.val', 'y'),
+			('connect', 'xf.TX', 'src.Out'),
+			]), edits
+
+		assert Node('recRoot|keep|sub|geo') is geo
+		assert Node('recRoot|renamed') is old
+		assert Node('recRoot|renamed|child') is oldChild
+		assert Node('recRoot|xf') is oldT
+		assert keep.val.get() == 'y'
+		assert oldT.TX.isConnected()
+		assert_raises(ValueError, Node, 'recRoot|gone')
+
+		# already reconciled
+		with ModificationContext() as mod:
+			assert mod.reconcile(target, root) == []
+
+	def testReconcileUnchanged(self):
+
+		with ModificationContext() as mod:
+			root = mod.createNode('recSame')
+			n = mod.createNode('n', 'TransformEuler', root)
+			src = mod.createNode('src', 'TransformEuler', root)
+
+		# connections given as Plug
+		target = [
+			{'name': 'n', 'type': 'TransformEuler', 'connections': [(n.TX, src.Out)]},
+			{'name': 'src', 'type': 'TransformEuler'},
+			]
+
+		with ModificationContext() as mod:
+			assert len(mod.reconcile(target, root)) == 1
+		with ModificationContext() as mod:
+			assert mod.reconcile(target, root) == []
+
+		# Point3 values
+		assert pyGuerilla._sameValue(Point3(1, 2, 3), Point3(1, 2, 3))
+		assert pyGuerilla._sameValue(Point3(1, 2, 3), (1, 2, 3))
+		assert not pyGuerilla._sameValue(Point3(1, 2, 3), Point3(1, 2, 4))
+
 	#def testDependency(self): 
 		#pass
 
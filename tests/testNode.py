@@ -7,8 +7,11 @@ Nose tests for Node class
 authors: sylvain delhomme <sylvain.delhomme@digital-district.ca>
 """
 
-from pyGuerilla import Document, Node, Camera, toLua
-from nose.tools import raises
+import sys
+
+import lua
+from pyGuerilla import Document, Node, Camera, ModificationContext, Point3, Gtypes, toLua
+from nose.tools import raises, assert_raises
 
 class TestNode(object):
 
@@ -58,3 +61,192 @@ class TestNode(object):
 	def testUnknownPlug(self):
 		Node('RenderPass').DummyDummyAttr
 
+
+	def testIdentity(self):
+
+		assert Node('RenderPass') is Node('RenderPass')
+
+		n1 = Node.createNode('idGrp')
+		n2 = Node.createNode('idChild', 'SceneGraphNode', n1)
+		assert n2.parent is n1
+		assert Node('idGrp|idChild') is n2
+		assert list(n1.children()) == [n2]
+
+	def testIdentityRename(self):
+
+		n = Node.createNode('idOld')
+		assert Node('idOld') is n
+		n.renameNode('idNew')
+		assert Node('idNew') is n
+		assert_raises(ValueError, Node, 'idOld')
+
+	def testIdentityDelete(self):
+
+		n = Node.createNode('idDeleted')
+		assert Node('idDeleted') is n
+		with ModificationContext() as mc:
+			mc.deleteNode(n)
+		assert_raises(ValueError, Node, 'idDeleted')
+
+	def testIdentityLuaEdit(self):
+
+		# edited in lua, outside of any ModificationContext
+		n = Node.createNode('idLuaOld')
+		assert Node('idLuaOld') is n
+		doc = Document()._doc
+		doc.getmodifier(doc).renamenode(n._node, 'idLuaNew')
+		assert_raises(ValueError, Node, 'idLuaOld')
+		assert Node('idLuaNew') is n
+
+	def testAttrCache(self):
+
+		n = Node.createNode('attrGrp')
+		assert_raises(AttributeError, getattr, n, 'attrPlug')
+		assert_raises(AttributeError, getattr, n, 'attrChild')
+		assert_raises(AttributeError, getattr, n, '_attrPrivate')
+
+		p = n.createPlug('attrPlug')
+		assert n.attrPlug is n.attrPlug
+		assert n.attrPlug.name == 'attrPlug'
+
+		c = Node.createNode('attrChild', 'SceneGraphNode', n)
+		assert n.attrChild is c
+
+		c.renameNode('attrRenamed')
+		assert_raises(AttributeError, getattr, n, 'attrChild')
+		assert n.attrRenamed is c
+
+		with ModificationContext() as mc:
+			mc.deletePlug(p)
+		assert_raises(AttributeError, getattr, n, 'attrPlug')
+
+		# edited in lua, outside of any ModificationContext
+		assert n.attrRenamed is c
+		doc = Document()._doc
+		doc.getmodifier(doc).renamenode(c._node, 'attrLua')
+		assert_raises(AttributeError, getattr, n, 'attrRenamed')
+		assert n.attrLua is c
+
+	def testWalk(self):
+
+		root = Node.createNode('walkRoot')
+		a = Node.createNode('a', 'SceneGraphNode', root)
+		b = Node.createNode('b', 'SceneGraphNode', root)
+		c = Node.createNode('c', 'SceneGraphNode', a)
+		d = Node.createNode('d', 'SceneGraphNode', c)
+
+		bfs = list(root.walk())
+		assert len(bfs) == 4
+		assert set(bfs[:2]) == set([a, b])
+		assert bfs[2:] == [c, d]
+
+		dfs = list(root.walk(order='dfs'))
+		assert len(dfs) == 4
+		assert dfs[dfs.index(a) + 1] == c
+		assert dfs[dfs.index(c) + 1] == d
+
+		assert set(root.walk(maxDepth=1)) == set([a, b])
+		assert list(root.walk(type='Camera')) == []
+
+		for order in ('bfs', 'dfs'):
+			pruned = list(root.walk(prune=lambda path: path.endswith('|a'), order=order))
+			assert set(pruned) == set([a, b])
+
+	def testWalkChunks(self):
+
+		import pyGuerilla
+		root = Node.createNode('walkChunks')
+		a = Node.createNode('a', 'SceneGraphNode', root)
+		nodes = [Node.createNode('n%d' % i, 'SceneGraphNode', a) for i in range(5)]
+		nodes += [Node.createNode('m%d' % i, 'SceneGraphNode', nodes[0]) for i in range(3)]
+
+		chunkSize = pyGuerilla.WALK_CHUNK_SIZE
+		pyGuerilla.WALK_CHUNK_SIZE = 2
+		try:
+			for order in ('bfs', 'dfs'):
+				assert set(root.walk(order=order)) == set([a] + nodes)
+				pruned = root.walk(prune=lambda path: path.endswith('|n0'), order=order)
+				assert set(pruned) == set([a] + nodes[:5])
+		finally:
+			pyGuerilla.WALK_CHUNK_SIZE = chunkSize
+
+	def testWalkOrder(self):
+		# checked when walk is called, not on first next()
+		assert_raises(ValueError, Node('RenderPass').walk, order='dummy')
+		assert_raises(ValueError, Document().walk, order='dummy')
+
+	def testSnapshot(self):
+
+		n = Node.createNode('snapGrp')
+		n.createPlug('snapValue').set('foo')
+		snapshot = n.snapshot()
+		assert snapshot['snapValue'] == 'foo'
+		assert set(snapshot) == set(p.name for p in n.plugs())
+
+		c = Node.createNode('snapChild', 'SceneGraphNode', n)
+		snapshots = Document().snapshot([n, c])
+		assert set(snapshots) == set(['snapGrp', 'snapGrp|snapChild'])
+		assert snapshots['snapGrp'] == snapshot
+		assert set(snapshots['snapGrp|snapChild']) == set(p.name for p in c.plugs())
+
+
+class TestMemory(object):
+
+	@classmethod
+	def setup_class(cls):
+		Document().new(warn=False)
+
+	def testSlots(self):
+
+		n = Node('RenderPass')
+		for obj in (n, Node('Perspective'), n.FileName, Point3(0, 1, 2), Gtypes('float')):
+			assert not hasattr(obj, '__dict__'), type(obj).__name__
+
+	def testWrapperSize(self):
+
+		class DictNode(Node):
+			# a Node as before slots: __dict__ and its own lua globals
+			pass
+
+		luaNode = Node('RenderPass')._node
+		luaGlobals = lua.globals()
+
+		def slotted():
+			n = object.__new__(Node)
+			n._id, n._node, n._attrCache = 0, luaNode, {}
+			return n
+
+		def unslotted():
+			n = object.__new__(DictNode)
+			n._id, n._node, n._attrCache = 0, luaNode, {}
+			n.__dict__['_luaGlobals'] = luaGlobals
+			return n
+
+		before = wrapperSize(unslotted)
+		after = wrapperSize(slotted)
+		print 'Node wrapper: %d bytes before, %d bytes after' % (before, after)
+		assert after < before
+
+
+def wrapperSize(factory, count=1000):
+
+	'''
+	Average memory of objects created by factory
+	tracemalloc on python 3, sys.getsizeof of the object and its __dict__ on python 2
+	'''
+
+	try:
+		import tracemalloc
+	except ImportError:
+		objs = [factory() for i in xrange(count)]
+		return sum(sys.getsizeof(o) + (sys.getsizeof(o.__dict__) if hasattr(o, '__dict__') else 0)
+				for o in objs) / count
+
+	tracemalloc.start()
+	try:
+		start = tracemalloc.take_snapshot()
+		objs = [factory() for i in range(count)]
+		stats = tracemalloc.take_snapshot().compare_to(start, 'filename')
+	finally:
+		tracemalloc.stop()
+	return sum(s.size_diff for s in stats) // count
@@ -7,7 +7,7 @@ Nose tests for Plug class
 authors: sylvain delhomme <sylvain.delhomme@digital-district.ca>
 """
 
-from pyGuerilla import Document, Node, Plug
+from pyGuerilla import Document, Node, Plug, ModificationContext, toLua, fromLua
 from nose.tools import raises
 
 class TestNode(object):
@@ -62,3 +62,46 @@ class TestNode(object):
 		nCo = n1.Transform.connections(source=True, destination=False)
 		assert nCo[0].name == t1.Out.name
 
+
+	def testFromHandle(self):
+
+		n = Node('RenderPass')
+		p = Plug.fromHandle(toLua(n.FileName))
+		assert p.name == 'FileName'
+		assert p.parent is n
+		assert p.parent is n
+		assert toLua(p) == toLua(n.FileName)
+		assert fromLua(toLua(n.FileName)).parent is n
+
+		doc = Document()
+		assert isinstance(Plug.fromHandle(toLua(doc.Time)).parent, Document)
+
+	def testClosure(self):
+
+		with ModificationContext() as mod:
+			a = mod.createNode('closureA', 'TransformEuler')
+			b = mod.createNode('closureB', 'TransformEuler')
+			c = mod.createNode('closureC', 'TransformEuler')
+			mod.connect(a.TX, b.Out)
+			mod.addDependency(b.Out, b.TX)
+			mod.connect(b.TX, c.Out)
+
+		def names(plugs):
+			return [(p.parent.name, p.name) for p in plugs]
+
+		assert names(a.TX.upstream()) == [('closureB', 'Out'), ('closureB', 'TX'), ('closureC', 'Out')]
+		assert names(a.TX.upstream(depth=1)) == [('closureB', 'Out')]
+		assert names(c.Out.downstream()) == [('closureB', 'TX'), ('closureB', 'Out'), ('closureA', 'TX')]
+		assert a.TX.downstream() == []
+
+		assert a.upstream() == [b, c]
+		assert a.upstream(depth=1) == [b]
+		assert c.downstream() == [b, a]
+
+	def testSample(self):
+
+		doc = Document()
+		doc.Time.set(7)
+		assert list(doc.Time.sample([1, 2, 3])) == [1, 2, 3]
+		assert list(doc.Time.sample([])) == []
+		assert doc.Time.get() == 7
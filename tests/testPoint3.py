@@ -0,0 +1,147 @@
+"""
+Copyright (c) 2013 Digital District
+----------------------------------------------------
+
+Nose tests for Point3 class
+
+authors: sylvain delhomme <sylvain.delhomme@digital-district.ca>
+"""
+
+import math
+
+from pyGuerilla import Document, Point3, Point3Array, toLua, fromLua
+
+class TestPoint3(object):
+
+	@classmethod
+	def setup_class(cls):
+		Document().new(warn=False)
+
+	def testLua(self):
+
+		p = Point3(1, 2, 3)
+		lp = toLua(p)
+		q = fromLua(lp)
+		assert isinstance(q, Point3)
+		assert q.value == [1.0, 2.0, 3.0]
+
+		# lua point3 built from the coordinates, lua edits are not seen
+		lp[1] = 9
+		assert q.value == [1.0, 2.0, 3.0]
+		assert fromLua(toLua(q)).value == [1.0, 2.0, 3.0]
+
+	def testArithmetic(self):
+
+		a = Point3(1, 2, 3)
+		b = Point3(4, 5, 6)
+
+		assert (a + b).value == [5, 7, 9]
+		assert (b - a).value == [3, 3, 3]
+		assert (-a).value == [-1, -2, -3]
+		assert (a * b).value == [4, 10, 18]
+		assert (a * 2).value == (2 * a).value == [2, 4, 6]
+		assert (b / 2).value == [2, 2.5, 3]
+		assert (Point3(1, 0, 0) ^ Point3(0, 1, 0)).value == [0, 0, 1]
+		assert a.dot(b) == 32
+
+	def testMetrics(self):
+
+		p = Point3(3, 4, 0)
+		assert p.squareLength == 25
+		assert p.length == 5
+		assert p.distance(Point3(0, 0, 0)) == 5
+		assert p.normalized().value == [0.6, 0.8, 0]
+		assert Point3(0, 0, 0).normalized().value == [0, 0, 0]
+		assert p.isReal
+		assert not Point3(float('inf'), 0, 0).isReal
+		assert not Point3(float('nan'), 0, 0).isReal
+
+	def testMinMax(self):
+
+		a = Point3(1, 5, 3)
+		b = Point3(4, 2, 6)
+		assert a.max(b).value == [4, 5, 6]
+		assert a.min(b).value == [1, 2, 3]
+		assert a.max(2).value == [2, 5, 3]
+		assert a.min(2).value == [1, 2, 2]
+
+class TestPoint3Array(object):
+
+	@classmethod
+	def setup_class(cls):
+		Document().new(warn=False)
+
+	def testCreate(self):
+
+		points = Point3Array([(1, 2, 3), Point3(4, 5, 6)])
+		assert len(points) == 2
+		assert points.value == [[1, 2, 3], [4, 5, 6]]
+		assert points[-1].value == [4, 5, 6]
+		assert [p.value for p in points] == points.value
+		assert len(Point3Array()) == 0
+
+	def testArithmetic(self):
+
+		a = Point3Array([(1, 2, 3), (0, 1, 0)])
+		b = Point3Array([(4, 5, 6), (0, 0, 1)])
+
+		assert (a + b).value == [[5, 7, 9], [0, 1, 1]]
+		assert (b - a).value == [[3, 3, 3], [0, -1, 1]]
+		assert (-a).value == [[-1, -2, -3], [0, -1, 0]]
+		assert (a * 2).value == (2 * a).value == [[2, 4, 6], [0, 2, 0]]
+		assert (a + Point3(1, 1, 1)).value == [[2, 3, 4], [1, 2, 1]]
+		assert (b / 2).value == [[2, 2.5, 3], [0, 0, 0.5]]
+		assert list(a.dot(b)) == [32, 0]
+		assert (a ^ b).value == [[-3, 6, -3], [1, 0, 0]]
+
+	def testReflected(self):
+
+		a = Point3Array([(1, 2, 3), (0, 1, 0)])
+		p = Point3(1, 1, 1)
+
+		assert (p + a).value == [[2, 3, 4], [1, 2, 1]]
+		assert (p - a).value == [[0, -1, -2], [1, 0, 1]]
+		assert (Point3(2, 4, 6) * a).value == [[2, 8, 18], [0, 4, 0]]
+		assert (Point3(2, 2, 2) / Point3Array([(1, 2, 4)])).value == [[2, 1, 0.5]]
+		assert (Point3(0, 0, 1) ^ Point3Array([(1, 0, 0)])).value == [[0, 1, 0]]
+
+	def testSlices(self):
+
+		points = Point3Array([(0, 0, 0), (1, 1, 1), (2, 2, 2), (3, 3, 3)])
+		assert isinstance(points[1:3], Point3Array)
+		assert points[1:3].value == [[1, 1, 1], [2, 2, 2]]
+		assert points[::2].value == [[0, 0, 0], [2, 2, 2]]
+		assert points[::-1][0].value == [3, 3, 3]
+		assert len(points[4:]) == 0
+
+	def testMetrics(self):
+
+		points = Point3Array([(3, 4, 0), (0, 0, 0)])
+		assert list(points.lengths()) == [5, 0]
+		assert points.normalized().value == [[0.6, 0.8, 0], [0, 0, 0]]
+
+	def testBoundingBox(self):
+
+		points = Point3Array([(1, 5, 3), (4, 2, 6), (-1, 3, 0)])
+		bboxMin, bboxMax = points.boundingBox()
+		assert bboxMin.value == [-1, 2, 0]
+		assert bboxMax.value == [4, 5, 6]
+		assert points.min(0).value == [[0, 0, 0], [0, 0, 0], [-1, 0, 0]]
+		assert points.max(Point3(2, 2, 2)).value == [[2, 5, 3], [4, 2, 6], [2, 3, 2]]
+
+	def testLua(self):
+
+		points = Point3Array([(1, 2, 3), (4.5, 5, 6)])
+		lpoints = toLua(points)
+		assert isinstance(fromLua(lpoints)[1], Point3)
+		assert Point3Array.fromLua(lpoints).value == points.value
+
+	def testLuaNonFinite(self):
+
+		inf = float('inf')
+		points = Point3Array([(1, inf, 3), (-inf, 5, float('nan'))])
+		lpoints = toLua(points)
+		assert fromLua(lpoints)[0].value == [1, inf, 3]
+		values = Point3Array.fromLua(lpoints).value
+		assert values[0] == [1, inf, 3] and values[1][:2] == [-inf, 5]
+		assert math.isnan(values[1][2])